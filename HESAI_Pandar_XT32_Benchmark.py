@@ -0,0 +1,283 @@
+'''
+* ***********************************************************************************************
+* @brief	  HESAI Pandar XT32 Pipeline Benchmark (synthetic packets, no sensor required)
+* @Version	  Python 3.8
+* ***********************************************************************************************
+'''
+import os
+import json
+import time
+import tempfile
+import argparse
+import numpy as np
+from multiprocessing import Process
+
+from HESAI_Pandar_XT32_Interface import (
+    PORT, XT_DATA_SIZE, XT_MAX_FRAME_SIZE, XT_UNIT_NUM, XT_MOTOR_SPEED_DEFAULT, XT_IMAGE_FIELD, VIEW_RANGE, VIEW_MAX_POINT,
+    XT_RETURN_STRONGEST, XT_RETURN_LAST_STRONGEST,
+    PacketGenerator, FrameAssembler, PolarFilter, Calibration, PacketRing, SharedFrameBuffer,
+    packetView, packetTime, firingBlocks, decodeFrame, writePCDFile, writeKittiFile, imageWidth, rangeImage, bevImage,
+    capture, save_data, emulator,
+)
+
+# CPU / RSS of process (optional: pip install psutil)
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+# ============= Measurement ============= #
+# CPU(%) and RSS(MB) of processes over the measured interval
+class Usage:
+    def __init__(self, pids):
+        self._own = list(pids) == [os.getpid()]
+        self._procs = [psutil.Process(pid) for pid in pids] if psutil is not None else []
+        for proc in self._procs:
+            proc.cpu_percent(None)
+        self._cpu = time.process_time()
+        self._wall = time.monotonic()
+
+    def result(self):
+        if psutil is None:
+            # Only the benchmark process itself can be measured without psutil
+            if not self._own:
+                return float('nan'), float('nan')
+            cpu = 100.0 * (time.process_time() - self._cpu) / max(time.monotonic() - self._wall, 1e-9)
+            return cpu, float('nan')
+        cpu = sum(proc.cpu_percent(None) for proc in self._procs)
+        rss = sum(proc.memory_info().rss for proc in self._procs) / 1e6
+        return cpu, rss
+
+# One result row: packets/s, frames/s, p50/p99 latency(ms), CPU(%), RSS(MB)
+def result(stage, packets, frames, elapsed, latency, usage):
+    latency = np.asarray(latency) * 1e3
+    cpu, rss = usage.result()
+    return {
+        "stage": stage,
+        "packets_per_s": packets / elapsed,
+        "frames_per_s": frames / elapsed,
+        "p50_ms": float(np.percentile(latency, 50)) if len(latency) else float('nan'),
+        "p99_ms": float(np.percentile(latency, 99)) if len(latency) else float('nan'),
+        "cpu_percent": cpu,
+        "rss_mb": rss,
+    }
+
+# Frames of whole revolutions cut by frame assembler
+def makeFrames(args, count):
+    generator = PacketGenerator(args.motor_speed, args.return_mode, args.scene)
+    assembler = FrameAssembler()
+    frames = []
+    while len(frames) < count:
+        raw = memoryview(generator.revolution().tobytes())
+        for i in range(0, len(raw), XT_DATA_SIZE):
+            frame = assembler.push(raw[i : i + XT_DATA_SIZE])
+            if frame is not None:
+                frames.append(bytes(frame))
+    return frames
+
+# ============= Stage Benchmark ============= #
+# save_data: frame assembly of packets
+def benchAssemble(args):
+    generator = PacketGenerator(args.motor_speed, args.return_mode, args.scene)
+    raw = memoryview(b"".join(generator.revolution().tobytes() for _ in range(args.frames + 2)))
+    assembler = FrameAssembler()
+    latency = []
+    frames = 0
+    usage = Usage([os.getpid()])
+    start = Time = time.perf_counter()
+    for i in range(0, len(raw), XT_DATA_SIZE):
+        if assembler.push(raw[i : i + XT_DATA_SIZE]) is not None:
+            frames += 1
+            latency.append(time.perf_counter() - Time)
+            Time = time.perf_counter()
+    return result("save_data", len(raw) // XT_DATA_SIZE, frames, time.perf_counter() - start, latency, usage)
+
+# unpack: decode + projection of frame
+def benchDecode(args):
+    frames = makeFrames(args, args.frames)
+    calibration = Calibration()
+    point_filter = PolarFilter(max_range=args.max_range)
+    latency = []
+    usage = Usage([os.getpid()])
+    start = time.perf_counter()
+    for frame in frames:
+        Time = time.perf_counter()
+        azim, dist, refl = decodeFrame(frame, args.returns)
+        i_valid = point_filter.apply(azim, dist, refl, firingBlocks(packetView(frame), args.returns))
+        calibration.project(azim[i_valid], i_valid % XT_UNIT_NUM, dist[i_valid], refl[i_valid])
+        latency.append(time.perf_counter() - Time)
+    packets = sum(len(frame) for frame in frames) // XT_DATA_SIZE
+    return result("unpack", packets, len(frames), time.perf_counter() - start, latency, usage)
+
+# Export: KITTI and PCD of every data type
+def benchExport(args):
+    frames = makeFrames(args, args.frames)
+    calibration = Calibration()
+    point_filter = PolarFilter(max_range=args.max_range)
+    clouds = []
+    for frame in frames:
+        azim, dist, refl = decodeFrame(frame, args.returns)
+        i_valid = point_filter.apply(azim, dist, refl, firingBlocks(packetView(frame), args.returns))
+        clouds.append(calibration.project(azim[i_valid], i_valid % XT_UNIT_NUM, dist[i_valid], refl[i_valid]))
+
+    rows = []
+    with tempfile.TemporaryDirectory() as dirs:
+        writers = [
+            ("kitti", lambda cnt, Xyzi: writeKittiFile(dirs, cnt, Xyzi)),
+            ("pcd_ascii", lambda cnt, Xyzi: writePCDFile("{}/{}.pcd".format(dirs, cnt), *Xyzi.T, data="ascii")),
+            ("pcd_binary", lambda cnt, Xyzi: writePCDFile("{}/{}.pcd".format(dirs, cnt), *Xyzi.T, data="binary")),
+            ("pcd_binary_compressed", lambda cnt, Xyzi: writePCDFile("{}/{}.pcd".format(dirs, cnt), *Xyzi.T, data="binary_compressed")),
+        ]
+        for name, write in writers:
+            latency = []
+            usage = Usage([os.getpid()])
+            start = time.perf_counter()
+            for cnt, Xyzi in enumerate(clouds):
+                Time = time.perf_counter()
+                write(cnt, Xyzi)
+                latency.append(time.perf_counter() - Time)
+            packets = sum(len(frame) for frame in frames) // XT_DATA_SIZE
+            rows.append(result(name, packets, len(clouds), time.perf_counter() - start, latency, usage))
+    return rows
+
+# Viewer: organized range image and decimated BEV image of frame
+def benchView(args):
+    frames = makeFrames(args, args.frames)
+    calibration = Calibration()
+    point_filter = PolarFilter(max_range=args.max_range)
+    width = imageWidth(args.motor_speed)
+    clouds = []
+    for frame in frames:
+        azim, dist, refl = decodeFrame(frame, args.returns)
+        i_valid = point_filter.apply(azim, dist, refl, firingBlocks(packetView(frame), args.returns))
+        Xyzi = calibration.project(azim[i_valid], i_valid % XT_UNIT_NUM, dist[i_valid], refl[i_valid])
+        clouds.append((azim[i_valid], i_valid % XT_UNIT_NUM, dist[i_valid], Xyzi))
+
+    latency = []
+    image = np.empty(XT_UNIT_NUM * width * XT_IMAGE_FIELD, dtype=np.float32)
+    usage = Usage([os.getpid()])
+    start = time.perf_counter()
+    for azim, channel, dist, Xyzi in clouds:
+        Time = time.perf_counter()
+        organized = rangeImage(azim, channel, dist, Xyzi, width, out=image)
+        step = -(-width * XT_UNIT_NUM // VIEW_MAX_POINT)
+        cloud = organized[:, ::step].reshape(-1, XT_IMAGE_FIELD)
+        cloud = cloud[cloud[:, 0] > 0]
+        bevImage(cloud[:, 2], cloud[:, 3], cloud[:, 1], args.view_range)
+        latency.append(time.perf_counter() - Time)
+    packets = sum(len(frame) for frame in frames) // XT_DATA_SIZE
+    return result("view", packets, len(frames), time.perf_counter() - start, latency, usage)
+
+# capture: loopback UDP stand-in sensor -> capture process -> ring
+def benchCapture(args):
+    ring = PacketRing()
+    processA = Process(target = capture, args = (args.port, ring))
+    processA.start()
+    time.sleep(0.5)
+    processE = Process(target = emulator, args = (args.port, "127.0.0.1", args.motor_speed, args.return_mode, args.scene, args.rate))
+    processE.start()
+
+    packets = 0
+    usage = Usage([processA.pid])
+    start = time.perf_counter()
+    try:
+        while time.perf_counter() - start < args.duration:
+            if ring.wait(0.1):
+                while ring.peek() is not None:
+                    ring.release()
+                    packets += 1
+    finally:
+        elapsed = time.perf_counter() - start
+        row = result("capture", packets, 0, elapsed, [], usage)
+        processE.terminate()
+        processA.terminate()
+        processE.join()
+        processA.join()
+        ring.close()
+    return row
+
+# End to end: stand-in sensor -> capture -> save_data -> unpack, latency from send time of the last packet of frame
+def benchPipeline(args):
+    ring = PacketRing()
+    frames = SharedFrameBuffer(XT_MAX_FRAME_SIZE, np.uint8)
+    calibration = Calibration()
+    point_filter = PolarFilter(max_range=args.max_range)
+    processA = Process(target = capture, args = (args.port, ring))
+    processA.start()
+    processB = Process(target = save_data, args = (ring, frames))
+    processB.start()
+    time.sleep(0.5)
+    processE = Process(target = emulator, args = (args.port, "127.0.0.1", args.motor_speed, args.return_mode, args.scene, args.rate))
+    processE.start()
+
+    packets = 0
+    count = 0
+    latency = []
+    usage = Usage([processA.pid, processB.pid, os.getpid()])
+    start = time.perf_counter()
+    try:
+        while time.perf_counter() - start < args.duration:
+            index, raw_data = frames.receive(timeout=0.1)
+            if raw_data is None:
+                continue
+            azim, dist, refl = decodeFrame(raw_data, args.returns)
+            i_valid = point_filter.apply(azim, dist, refl, firingBlocks(packetView(raw_data), args.returns))
+            calibration.project(azim[i_valid], i_valid % XT_UNIT_NUM, dist[i_valid], refl[i_valid])
+
+            # Packet time is wall clock of emulator only in real-time rate
+            packet = packetView(raw_data)
+            if args.rate == 1.0:
+                latency.append(time.time() - packetTime(packet[-1:])[0])
+            packets += len(packet)
+            count += 1
+            frames.release(index)
+    finally:
+        elapsed = time.perf_counter() - start
+        row = result("end_to_end", packets, count, elapsed, latency, usage)
+        for process in (processE, processA, processB):
+            process.terminate()
+            process.join()
+        ring.close()
+        frames.close()
+    return row
+
+STAGES = {
+    "assemble": benchAssemble,
+    "decode": benchDecode,
+    "export": benchExport,
+    "view": benchView,
+    "capture": benchCapture,
+    "pipeline": benchPipeline,
+}
+
+# ============= Main ============= #
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--stage', nargs='+', default=list(STAGES), choices=list(STAGES))
+    parser.add_argument('--frames', type=int, default=50, help="frame number of assemble, decode, export, view")
+    parser.add_argument('--duration', type=float, default=5.0, help="seconds of capture, pipeline")
+    parser.add_argument('--rate', type=float, default=1.0, help="stand-in sensor speed (0: as fast as possible)")
+    parser.add_argument('--motor-speed', type=int, default=XT_MOTOR_SPEED_DEFAULT, choices=[600, 1200])
+    parser.add_argument('--dual', action='store_true', help="last and strongest dual return mode")
+    parser.add_argument('--returns', default="all")
+    parser.add_argument('--scene', default="room")
+    parser.add_argument('--max-range', type=float, default=None, help="range gate(m) of decode")
+    parser.add_argument('--view-range', type=float, default=VIEW_RANGE, help="half width(m) of BEV image")
+    parser.add_argument('--port', type=int, default=PORT + 100)
+    parser.add_argument('--json', default=None, help="write results to JSON file")
+    args = parser.parse_args()
+    args.return_mode = XT_RETURN_LAST_STRONGEST if args.dual else XT_RETURN_STRONGEST
+
+    rows = []
+    for stage in args.stage:
+        row = STAGES[stage](args)
+        rows.extend(row if isinstance(row, list) else [row])
+
+    # Print result table
+    print("{:<24}{:>12}{:>10}{:>10}{:>10}{:>8}{:>10}".format("stage", "packets/s", "frames/s", "p50(ms)", "p99(ms)", "cpu%", "rss(MB)"))
+    for row in rows:
+        print("{stage:<24}{packets_per_s:>12.0f}{frames_per_s:>10.1f}{p50_ms:>10.2f}{p99_ms:>10.2f}{cpu_percent:>8.1f}{rss_mb:>10.1f}".format(**row))
+
+    if args.json is not None:
+        with open(args.json, 'w') as fp:
+            json.dump({"args": {k: v for k, v in vars(args).items()}, "results": rows}, fp, indent=2)
@@ -7,19 +7,45 @@
 * @Version	  Python 3.8
 * ***********************************************************************************************
 '''
+import os
+import glob
+import mmap
+import struct
+import hashlib
+import argparse
 import socket
+import select
 import time
 import traceback
+import warnings
 import numpy as np
-from multiprocessing import Process, Pipe
+import queue
+from multiprocessing import Process, Event, Queue, shared_memory
+from multiprocessing.util import register_after_fork
 import matplotlib.pyplot as plt
 
+# LZF for PCD binary_compressed (optional: pip install python-lzf)
+try:
+    import lzf
+except ImportError:
+    lzf = None
+
 # ============= HESAI Pandar XT-32 Specification ============= #
 HOST = "192.168.1.201"
 PORT = 2368
+RCVBUF_SIZE = 8 * 1024 * 1024
+CAPTURE_BATCH = 64
+RECORD_CHUNK_PACKET = 100000
+WRITER_QUEUE_SIZE = 8
 DISTANCE_RESOLUTION = 0.004
 AZIMUTH_UNIT = 0.01
-V_ANGLE_GLB = np.arange(127999,-1,-1) % 32 - 16
+# Default vertical angle of channel 0~31 (+15 ~ -16 deg) without calibration file
+V_ANGLE_DEFAULT = np.arange(15, -17, -1)
+CALIBRATION_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "calibration_cache")
+# BEV viewer: half width(m), image size(pixel), point budget per frame
+VIEW_RANGE = 3.0
+VIEW_PIXEL = 256
+VIEW_MAX_POINT = 32768
 
 # Reflectivity Mapping(0~255 -> %)
 REFLECT_MAP = {
@@ -50,6 +76,7 @@ REFLECT_MAP = {
     241:239.28, 242:240.41, 243:241.53, 244:242.66, 245:243.79, 246:244.92, 247:246.05, 248:247.18, 249:248.31, 250:249.44,
     251:250.56, 252:251.69, 253:252.82, 254:253.95, 255:255.08
 }
+REFLECT_LUT = np.array([REFLECT_MAP[k] for k in range(256)], dtype=np.float32)
 
 # ============= Packet Data Size Definition ============= #
 # TimeStamp_Sensor
@@ -86,244 +113,1626 @@ XT_TAIL_SIZE = 28
 XT_DATA_SIZE = XT_HEAD_SIZE + XT_BODY_SIZE + XT_TAIL_SIZE
 XT_PACKET_SIZE = XT_DATA_SIZE + WIN_TIMESTAMP_SIZE
 XT_MAX_POINT_SIZE = 256
+XT_AZIMUTH_OFFSET = XT_HEAD_SIZE
+XT_SEQUENCE_OFFSET = XT_DATA_SIZE - XT_SEQUENCE_SIZE
+XT_MOTOR_SPEED_OFFSET = XT_HEAD_SIZE + XT_BODY_SIZE + XT_RESERVED_SIZE
+
+# Frame (1 revolution): 20000 firings per second, 4 firings per packet in dual return mode
+XT_AZIMUTH_STEP = 36000
+XT_FIRING_FREQUENCY = 20000
+
+# Firing time offset from packet timestamp: block(single / dual return) and channel
+XT_FIRING_PERIOD = 1.0 / XT_FIRING_FREQUENCY
+XT_BLOCK_TIME_BASE = 3.28e-6
+XT_CHANNEL_TIME_BASE = 0.28e-6
+XT_CHANNEL_TIME_STEP = 1.512e-6
+XT_MOTOR_SPEED_DEFAULT = 600
+XT_FRAME_PACKET_MARGIN = 12
+XT_MAX_FRAME_PACKET = 512
+XT_MAX_FRAME_SIZE = XT_DATA_SIZE * XT_MAX_FRAME_PACKET
+XT_MAX_FRAME_POINT = XT_MAX_POINT_SIZE * XT_MAX_FRAME_PACKET
+
+# Organized range image: channel x column(firing of 1 revolution) x (range, I, X, Y, Z)
+XT_IMAGE_FIELD = 5
+XT_MAX_IMAGE_WIDTH = XT_FIRING_FREQUENCY * 60 // XT_MOTOR_SPEED_DEFAULT
+XT_MAX_IMAGE_SIZE = XT_UNIT_NUM * XT_MAX_IMAGE_WIDTH * XT_IMAGE_FIELD
+
+# Return mode(tail echo byte) and return carried by even / odd block in dual return mode
+XT_RETURN_FIRST = 0x33
+XT_RETURN_STRONGEST = 0x37
+XT_RETURN_LAST = 0x38
+XT_RETURN_LAST_STRONGEST = 0x39
+XT_RETURN_LAST_FIRST = 0x3B
+XT_RETURN_FIRST_STRONGEST = 0x3C
+XT_DUAL_RETURN = {
+    XT_RETURN_LAST_STRONGEST: ("last", "strongest"),
+    XT_RETURN_LAST_FIRST: ("last", "first"),
+    XT_RETURN_FIRST_STRONGEST: ("first", "strongest"),
+}
+
+# ============= Packet Structure Definition ============= #
+# Unit: distance(uint16, little endian), reflectivity(uint8), reserved(uint8)
+XT_UNIT_DTYPE = np.dtype([
+    ('distance', '<u2'),
+    ('reflectivity', 'u1'),
+    ('reserved', 'u1'),
+])
+
+# Block: azimuth(uint16, little endian) + 32 units
+XT_BLOCK_DTYPE = np.dtype([
+    ('azimuth', '<u2'),
+    ('units', XT_UNIT_DTYPE, (XT_UNIT_NUM,)),
+])
+
+# Tail: reserved, motor speed, timestamp(us), return mode, factory information, UTC, UDP sequence
+XT_TAIL_DTYPE = np.dtype([
+    ('reserved', 'u1', (XT_RESERVED_SIZE,)),
+    ('motor_speed', '<u2'),
+    ('timestamp', '<u4'),
+    ('return_mode', 'u1'),
+    ('factory', 'u1'),
+    ('utc', 'u1', (XT_UTC_SIZE,)),
+    ('sequence', '<u4'),
+])
+
+# Packet: head + 8 blocks + tail (1080 bytes)
+XT_PACKET_DTYPE = np.dtype([
+    ('head', 'u1', (XT_HEAD_SIZE,)),
+    ('blocks', XT_BLOCK_DTYPE, (XT_BLOCK_NUMBER,)),
+    ('tail', XT_TAIL_DTYPE),
+])
+assert XT_UNIT_DTYPE.itemsize == XT_UNIT_SIZE
+assert XT_BLOCK_DTYPE.itemsize == XT_BLOCK_SIZE
+assert XT_TAIL_DTYPE.itemsize == XT_TAIL_SIZE
+assert XT_PACKET_DTYPE.itemsize == XT_DATA_SIZE
+
+# ============= Packet Decoding Function ============= #
+# View raw frame bytes(1080 * N bytes) as structured packet array without copying
+def packetView(raw_data):
+    count = len(raw_data) // XT_DATA_SIZE
+    return np.frombuffer(raw_data, dtype=XT_PACKET_DTYPE, count=count)
+
+# Days since 1970-01-01 of civil date (vectorized)
+def daysFromCivil(year, month, day):
+    year = year - (month <= 2)
+    era = year // 400
+    yoe = year - era * 400
+    doy = (153 * (month + np.where(month > 2, -3, 9)) + 2) // 5 + day - 1
+    doe = yoe * 365 + yoe // 4 - yoe // 100 + doy
+    return era * 146097 + doe - 719468
+
+# Epoch seconds of packet from UTC(year - 1900, month, day, hour, minute, second) + timestamp(us)
+def packetTime(packets):
+    utc = packets['tail']['utc'].astype(np.int64)
+    days = daysFromCivil(utc[:, 0] + 1900, utc[:, 1], utc[:, 2])
+    return days * 86400.0 + utc[:, 3] * 3600 + utc[:, 4] * 60 + utc[:, 5] + packets['tail']['timestamp'] * 1e-6
+
+# Return mode of frame from echo byte of the first packet
+def returnMode(packets):
+    return int(packets['tail']['return_mode'][0]) if len(packets) > 0 else XT_RETURN_STRONGEST
+
+# Block slice of requested return (returns: all, first, strongest, last, dedup)
+# Return missing in the dual return mode falls back to all returns (warned once per return mode)
+def blockSlice(packets, returns="all"):
+    pair = XT_DUAL_RETURN.get(returnMode(packets))
+    if pair is None or returns in ("all", "dedup"):
+        return slice(None)
+    if returns not in pair:
+        warnings.warn("return '{}' is not in return mode {}, all returns are used".format(returns, hex(returnMode(packets))))
+        return slice(None)
+    return slice(pair.index(returns), None, XT_DUAL_BLOCK_RES)
+
+# Block number of one firing in decoded frame: both returns of dual return mode are in a block pair
+def firingBlocks(packets, returns="all"):
+    if returnMode(packets) in XT_DUAL_RETURN and blockSlice(packets, returns) == slice(None):
+        return XT_DUAL_BLOCK_RES
+    return 1
+
+# Block view of requested return without copying
+def selectBlocks(packets, returns="all"):
+    return packets['blocks'][:, blockSlice(packets, returns)]
+
+# Decode azimuth, distance, reflectivity of every point in frame (point order: packet -> block -> channel)
+# Dual return mode: one return, both returns(all), or both returns without duplicated second return(dedup)
+def decodeFrame(raw_data, returns="all"):
+    packets = packetView(raw_data)
+    blocks = selectBlocks(packets, returns)
+    units = blocks['units']
+
+    # Azimuth is shared by 32 channels of the block
+    azim = np.broadcast_to(blocks['azimuth'][:, :, np.newaxis], units.shape).reshape(-1)
+    dist = units['distance'].flatten()
+    refl = units['reflectivity'].reshape(-1)
+
+    # Second return of block pair hitting the same target as the first return is invalidated
+    if returns == "dedup" and returnMode(packets) in XT_DUAL_RETURN:
+        pair = units['distance'].reshape(len(packets), XT_DUAL_BLOCK_SIZE, XT_DUAL_BLOCK_RES, XT_UNIT_NUM)
+        duplicate = np.zeros(pair.shape, dtype=bool)
+        duplicate[:, :, 1] = pair[:, :, 1] == pair[:, :, 0]
+        dist[duplicate.reshape(-1)] = 0
+    return azim, dist, refl
+
+# Firing time offset(s) of block 0~7 from packet timestamp (timestamp is the last firing of packet)
+def blockTimeOffset(return_mode):
+    if return_mode in XT_DUAL_RETURN:
+        firing = np.arange(XT_BLOCK_NUMBER) // XT_DUAL_BLOCK_RES
+        return XT_BLOCK_TIME_BASE - XT_FIRING_PERIOD * (XT_DUAL_BLOCK_SIZE - 1 - firing)
+    return XT_BLOCK_TIME_BASE - XT_FIRING_PERIOD * (XT_SINGLE_BLOCK_SIZE - 1 - np.arange(XT_BLOCK_NUMBER))
+
+# Firing time offset(s) of channel 0~31 in block
+XT_CHANNEL_TIME_OFFSET = XT_CHANNEL_TIME_BASE + XT_CHANNEL_TIME_STEP * np.arange(XT_UNIT_NUM)
+
+# Epoch seconds of every point in frame (same point order as decodeFrame)
+def decodeTimes(raw_data, returns="all"):
+    packets = packetView(raw_data)
+    block_offset = blockTimeOffset(returnMode(packets))[blockSlice(packets, returns)]
+    times = packetTime(packets)[:, np.newaxis, np.newaxis] + block_offset[:, np.newaxis] + XT_CHANNEL_TIME_OFFSET
+    return times.reshape(-1)
+
+# ============= Calibration ============= #
+# Angle correction(deg) of channel 0~31 from HESAI calibration CSV (Laser id, Elevation, Azimuth)
+def loadAngleCorrection(fname):
+    table = np.loadtxt(fname, delimiter=',', skiprows=1, ndmin=2)
+    order = np.argsort(table[:, 0])
+    elevation = table[order, 1]
+    azimuth = table[order, 2]
+    assert len(elevation) == XT_UNIT_NUM, len(elevation)
+    return elevation, azimuth
+
+# Precomputed direction table for every azimuth step(0.01 deg) x channel, cached on disk by calibration hash
+class Calibration:
+    def __init__(self, fname=None, cache_dir=CALIBRATION_CACHE_DIR):
+        # Calibration file or default vertical angle without azimuth offset
+        if fname is None:
+            self.elevation = V_ANGLE_DEFAULT.astype(np.float64)
+            self.azimuth = np.zeros(XT_UNIT_NUM)
+            key = "default_" + hashlib.sha1(self.elevation.tobytes() + self.azimuth.tobytes()).hexdigest()
+        else:
+            self.elevation, self.azimuth = loadAngleCorrection(fname)
+            with open(fname, 'rb') as fp:
+                key = hashlib.sha1(fp.read()).hexdigest()
+
+        # Load table from cache or compute and store it
+        cache = os.path.join(cache_dir, "xt32_{}.npy".format(key))
+        try:
+            self.table = np.load(cache)
+            if self.table.shape != (XT_AZIMUTH_STEP, XT_UNIT_NUM, 3) or self.table.dtype != np.float32:
+                raise ValueError("stale calibration cache {}".format(cache))
+        except (OSError, ValueError):
+            self.table = self._compute()
+            try:
+                os.makedirs(cache_dir, exist_ok=True)
+                temporary = "{}.{}.tmp.npy".format(cache, os.getpid())
+                np.save(temporary, self.table)
+                os.replace(temporary, cache)
+            except OSError as e:
+                print(e)
+
+    # Table (36000 x 32 x 3): cos(v)sin(h), cos(v)cos(h), sin(v)
+    def _compute(self):
+        h_angle = np.deg2rad(np.arange(XT_AZIMUTH_STEP)[:, np.newaxis] * AZIMUTH_UNIT + self.azimuth)
+        v_angle = np.deg2rad(self.elevation)
+        table = np.empty((XT_AZIMUTH_STEP, XT_UNIT_NUM, 3), dtype=np.float32)
+        table[:, :, 0] = np.cos(v_angle) * np.sin(h_angle)
+        table[:, :, 1] = np.cos(v_angle) * np.cos(h_angle)
+        table[:, :, 2] = np.sin(v_angle)
+        return table
+
+    # Project azimuth, channel, raw distance, raw reflectivity to X, Y, Z, I (N x 4) by gather and multiply
+    def project(self, azim, channel, dist, refl, out=None):
+        if out is None:
+            out = np.empty((len(dist), 4), dtype=np.float32)
+        out = out[:len(dist)]
+        direction = self.table[azim % XT_AZIMUTH_STEP, channel]
+        np.multiply(direction, (dist * DISTANCE_RESOLUTION)[:, np.newaxis], out=out[:, 0:3], casting='unsafe')
+        out[:, 3] = REFLECT_LUT[refl]
+        return out
+
+# ============= Motion Compensation ============= #
+# Rotate vectors(N x 3) by quaternions(N x 4, w x y z)
+def quaternionRotate(quaternion, vector):
+    w = quaternion[:, 0:1]
+    q = quaternion[:, 1:4]
+    cross = 2.0 * np.cross(q, vector)
+    return vector + w * cross + np.cross(q, cross)
+
+# Constant velocity ego motion: linear(m/s) and angular(rad/s) velocity in sensor frame
+class ConstantVelocity:
+    def __init__(self, linear=(0.0, 0.0, 0.0), angular=(0.0, 0.0, 0.0)):
+        self.linear = np.asarray(linear, dtype=np.float64)
+        self.angular = np.asarray(angular, dtype=np.float64)
+
+    # Sensor pose of point time relative to reference time: axis-angle rotation and translation
+    def transform(self, xyz, dt):
+        dt = dt[:, np.newaxis]
+        speed = np.linalg.norm(self.angular)
+        if speed > 0:
+            # Rodrigues rotation about angular velocity axis by speed * dt
+            axis = self.angular / speed
+            theta = speed * dt
+            cos, sin = np.cos(theta), np.sin(theta)
+            xyz = xyz * cos + np.cross(axis, xyz) * sin + axis * (xyz @ axis)[:, np.newaxis] * (1 - cos)
+        return xyz + self.linear * dt
+
+# Ego pose stream: time(s), position(m), quaternion(w x y z) of sensor in world frame
+class PoseTrajectory:
+    def __init__(self, maxlen=1000):
+        self.maxlen = maxlen
+        self.times = np.empty(0)
+        self.positions = np.empty((0, 3))
+        self.quaternions = np.empty((0, 4))
+
+    def append(self, t, position, quaternion):
+        self.times = np.append(self.times, t)[-self.maxlen:]
+        self.positions = np.vstack((self.positions, position))[-self.maxlen:]
+        self.quaternions = np.vstack((self.quaternions, quaternion))[-self.maxlen:]
+
+    # Pose stream from text file: time(s), x, y, z(m), qw, qx, qy, qz per line
+    @classmethod
+    def load(cls, fname):
+        table = np.loadtxt(fname, ndmin=2)
+        trajectory = cls(maxlen=max(len(table), 2))
+        order = np.argsort(table[:, 0], kind='stable')
+        trajectory.times = table[order, 0]
+        trajectory.positions = table[order, 1:4]
+        trajectory.quaternions = table[order, 4:8]
+        return trajectory
+
+    # Pose at times by linear interpolation of position and normalized quaternion (clamped at both ends)
+    def interpolate(self, times):
+        i_next = np.clip(np.searchsorted(self.times, times), 1, len(self.times) - 1)
+        i_prev = i_next - 1
+        span = self.times[i_next] - self.times[i_prev]
+        alpha = np.clip((times - self.times[i_prev]) / np.where(span > 0, span, 1), 0, 1)[:, np.newaxis]
+        position = self.positions[i_prev] * (1 - alpha) + self.positions[i_next] * alpha
+        q_prev = self.quaternions[i_prev]
+        q_next = self.quaternions[i_next] * np.sign(np.sum(q_prev * self.quaternions[i_next], axis=1, keepdims=True) + 1e-12)
+        quaternion = q_prev * (1 - alpha) + q_next * alpha
+        return position, quaternion / np.linalg.norm(quaternion, axis=1, keepdims=True)
+
+    # Point in sensor frame of point time -> world -> sensor frame of reference time
+    def transform(self, xyz, dt, ref_time):
+        if len(self.times) < 2:
+            return xyz
+        position, quaternion = self.interpolate(ref_time + dt)
+        ref_position, ref_quaternion = self.interpolate(np.array([ref_time]))
+        world = quaternionRotate(quaternion, xyz) + position
+        inverse = ref_quaternion * np.array([1.0, -1.0, -1.0, -1.0])
+        return quaternionRotate(np.broadcast_to(inverse, quaternion.shape), world - ref_position)
+
+# Transform X, Y, Z of every point to the single reference time (default: the last point) in one batch
+def deskew(Xyzi, times, motion, ref_time=None):
+    if len(times) == 0:
+        return Xyzi
+    if ref_time is None:
+        ref_time = times.max()
+    dt = times - ref_time
+    xyz = Xyzi[:, 0:3].astype(np.float64)
+    if isinstance(motion, PoseTrajectory):
+        Xyzi[:, 0:3] = motion.transform(xyz, dt, ref_time)
+    else:
+        Xyzi[:, 0:3] = motion.transform(xyz, dt)
+    return Xyzi
+
+# ============= Point Filter ============= #
+# Polar space filter on raw decoded values before projection: range(m), azimuth sector(deg), channel, intensity, column stride
+class PolarFilter:
+    def __init__(self, min_range=0.0, max_range=None, sector=None, channels=None, min_intensity=0, column_stride=1):
+        # Raw distance gate (zero distance is always invalid)
+        self.min_dist = max(int(np.ceil(min_range / DISTANCE_RESOLUTION)), 1)
+        self.max_dist = 0xFFFF if max_range is None else int(max_range / DISTANCE_RESOLUTION)
+
+        # Azimuth sector [start, end) in deg, wrapping through 0 if start > end
+        self.sector = None
+        if sector is not None:
+            start, end = (int(round(angle / AZIMUTH_UNIT)) % XT_AZIMUTH_STEP for angle in sector)
+            steps = np.arange(XT_AZIMUTH_STEP)
+            self.sector = (steps >= start) & (steps < end) if start < end else (steps >= start) | (steps < end)
+
+        # Channel 0~31 to keep
+        self.channels = None
+        if channels is not None:
+            self.channels = np.zeros(XT_UNIT_NUM, dtype=bool)
+            self.channels[list(channels)] = True
+
+        self.min_intensity = min_intensity
+        self.column_stride = column_stride
+
+    # Index of points passing every filter (point order of decodeFrame, firing_blocks: see firingBlocks)
+    def apply(self, azim, dist, refl, firing_blocks=1):
+        valid = (dist >= self.min_dist) & (dist <= self.max_dist)
+        by_block = valid.reshape(-1, XT_UNIT_NUM)
+        if self.channels is not None:
+            by_block &= self.channels
+        if self.column_stride > 1:
+            # Range image downsampling: keep every column_stride-th firing
+            firing = np.arange(len(by_block)) // firing_blocks
+            by_block[firing % self.column_stride != 0] = False
+        if self.sector is not None:
+            valid &= self.sector[azim % XT_AZIMUTH_STEP]
+        if self.min_intensity > 0:
+            valid &= refl >= self.min_intensity
+        return np.flatnonzero(valid)
+
+# Voxel grid downsampling: centroid of X, Y, Z, I in every occupied voxel(m)
+def voxelDownsample(Xyzi, voxel_size):
+    if len(Xyzi) == 0:
+        return Xyzi
+    voxel = np.floor(Xyzi[:, 0:3] / voxel_size).astype(np.int64)
+    voxel -= voxel.min(axis=0)
+    extent = voxel.max(axis=0) + 1
+    key = (voxel[:, 0] * extent[1] + voxel[:, 1]) * extent[2] + voxel[:, 2]
+    _, inverse, count = np.unique(key, return_inverse=True, return_counts=True)
+    inverse = inverse.reshape(-1)
+    out = np.empty((len(count), 4), dtype=Xyzi.dtype)
+    for column in range(4):
+        out[:, column] = np.bincount(inverse, weights=Xyzi[:, column], minlength=len(count)) / count
+    return out
+
+# ============= Organized Range Image ============= #
+# Column number of range image from motor speed(RPM): firing number per revolution (at most the image slot width)
+def imageWidth(motor_speed, column_stride=1):
+    if motor_speed <= 0:
+        motor_speed = XT_MOTOR_SPEED_DEFAULT
+    return max(min(XT_FIRING_FREQUENCY * 60 // motor_speed, XT_MAX_IMAGE_WIDTH) // column_stride, 1)
+
+# Scatter projected points to range image (32 x width x 5) by channel and azimuth column (empty cell: 0)
+# Dual return mode with returns="all" keeps the return of odd block, written last
+def rangeImage(azim, channel, dist, Xyzi, width, out=None):
+    size = XT_UNIT_NUM * width * XT_IMAGE_FIELD
+    if out is None:
+        out = np.empty(size, dtype=np.float32)
+    image = out[:size].reshape(XT_UNIT_NUM, width, XT_IMAGE_FIELD)
+    image[:] = 0
+    column = (azim.astype(np.int64) % XT_AZIMUTH_STEP) * width // XT_AZIMUTH_STEP
+    cell = channel * width + column
+    pixels = image.reshape(-1, XT_IMAGE_FIELD)
+    pixels[cell, 0] = dist * DISTANCE_RESOLUTION
+    pixels[cell, 1] = Xyzi[:, 3]
+    pixels[cell, 2:5] = Xyzi[:, 0:3]
+    return image
+
+# ============= Frame Assembly ============= #
+# Maximum packet number per revolution from motor speed(RPM) in packet tail
+def maxPacketPerFrame(motor_speed):
+    if motor_speed <= 0:
+        motor_speed = XT_MOTOR_SPEED_DEFAULT
+    firing = XT_FIRING_FREQUENCY * 60 // motor_speed
+    return min(-(-firing // XT_DUAL_BLOCK_SIZE) + XT_FRAME_PACKET_MARGIN, XT_MAX_FRAME_PACKET)
+
+# Cut frame exactly when block azimuth wraps around the cut angle (deg)
+class FrameAssembler:
+    def __init__(self, cut_angle=0.0):
+        self.cut_azimuth = int(round(cut_angle / AZIMUTH_UNIT)) % XT_AZIMUTH_STEP
+        self.motor_speed = 0
+        self.capacity = 0
+        self.size = 0
+        self.overflow = 0
+        self._buffers = None
+        self._current = 0
+        self._last = None
+        self._synced = False
+
+    # Preallocate double buffer for maximum packet number per revolution (grown only, partial frame is kept)
+    def _allocate(self, motor_speed):
+        capacity = maxPacketPerFrame(motor_speed)
+        allocated = len(self._buffers[0]) // XT_DATA_SIZE if self._buffers is not None else 0
+        if capacity > allocated:
+            buffers = [bytearray(capacity * XT_DATA_SIZE), bytearray(capacity * XT_DATA_SIZE)]
+            if self._buffers is not None:
+                buffers[self._current][:self.size] = self._buffers[self._current][:self.size]
+            self._buffers = tuple(buffers)
+        self.motor_speed = motor_speed
+        self.capacity = capacity
+
+    # Swap buffer and return completed frame (view is valid until the next completed frame)
+    def _complete(self):
+        frame = memoryview(self._buffers[self._current])[:self.size]
+        self._current ^= 1
+        self.size = 0
+        return frame
+
+    # Append packet and return completed frame when it starts a new revolution (None otherwise)
+    def push(self, data):
+        azim = int.from_bytes(data[XT_AZIMUTH_OFFSET : XT_AZIMUTH_OFFSET + XT_AZIMUTH_SIZE], 'little')
+        motor_speed = int.from_bytes(data[XT_MOTOR_SPEED_OFFSET : XT_MOTOR_SPEED_OFFSET + XT_ENGINE_VELOCITY], 'little')
+        if motor_speed != self.motor_speed:
+            self._allocate(motor_speed)
+
+        # Azimuth relative to cut angle steps forward by less than half a revolution and wraps once per revolution
+        # Backward step (reordering, also across the cut angle) keeps the furthest azimuth so it can't wrap again
+        rel_azim = (azim - self.cut_azimuth) % XT_AZIMUTH_STEP
+        forward = self._last is None or (rel_azim - self._last) % XT_AZIMUTH_STEP < XT_AZIMUTH_STEP // 2
+        wrap = self._last is not None and forward and rel_azim < self._last
+        if forward:
+            self._last = rel_azim
+
+        frame = None
+        if wrap:
+            # Leading half-rotation before the first wrap is discarded
+            if self._synced and self.size > 0:
+                frame = self._complete()
+            self.size = 0
+            self._synced = True
+        elif self.size >= self.capacity * XT_DATA_SIZE:
+            # Azimuth did not wrap within maximum packet number per revolution
+            self.overflow += 1
+            frame = self._complete()
+
+        if self._synced:
+            self._buffers[self._current][self.size : self.size + XT_DATA_SIZE] = data[:XT_DATA_SIZE]
+            self.size += XT_DATA_SIZE
+        return frame
+
+# ============= Packet Loss Accounting ============= #
+# Recent gaps(start, length) kept to tell late packets from duplicates
+SEQUENCE_GAP_HISTORY = 64
+# Backward jump beyond one revolution of packets outside recorded gaps is a sensor / capture restart
+SEQUENCE_RESTART_GAP = XT_MAX_FRAME_PACKET
+
+# Count gap, reordering, duplicate and restart of UDP sequence number(uint32) in packet tail
+class SequenceCounter:
+    def __init__(self):
+        self.received = 0
+        self.dropped = 0
+        self.reordered = 0
+        self.duplicated = 0
+        self.restarted = 0
+        self._expected = None
+        self._gaps = []
+
+    # Remove late sequence from the counted gap containing it (False if it is in no gap)
+    def _fill(self, sequence):
+        for i, (start, length) in enumerate(self._gaps):
+            offset = (sequence - start) & 0xFFFFFFFF
+            if offset < length:
+                self._gaps[i : i + 1] = [gap for gap in ((start, offset), ((sequence + 1) & 0xFFFFFFFF, length - offset - 1)) if gap[1] > 0]
+                return True
+        return False
+
+    def update(self, sequence):
+        self.received += 1
+        if self._expected is None:
+            self._expected = (sequence + 1) & 0xFFFFFFFF
+            return
+        gap = (sequence - self._expected) & 0xFFFFFFFF
+        if gap == 0:
+            self._expected = (sequence + 1) & 0xFFFFFFFF
+        elif gap < 0x80000000:
+            # Packets between expected and received sequence are missing
+            self.dropped += gap
+            self._gaps = (self._gaps + [(self._expected, gap)])[-SEQUENCE_GAP_HISTORY:]
+            self._expected = (sequence + 1) & 0xFFFFFFFF
+        elif self._fill(sequence):
+            # Late packet was already counted as missing
+            self.reordered += 1
+            self.dropped -= 1
+        elif (self._expected - sequence) & 0xFFFFFFFF > SEQUENCE_RESTART_GAP:
+            # Sequence started over: resync instead of counting every packet as duplicate
+            self.restarted += 1
+            self._gaps = []
+            self._expected = (sequence + 1) & 0xFFFFFFFF
+        else:
+            # Repeat of received packet (e.g. sequence == expected - 1)
+            self.duplicated += 1
 
 # ============= Point Cloud Data Save Funciton ============= #
-# Write point cloud data to PCD Format
-def writePCDFile(fname,x,y,z,i):
+# LZF literal runs (max 32 bytes) readable by PCL when lzf module is not installed
+def lzfLiteral(raw):
+    raw = np.frombuffer(raw, dtype=np.uint8)
+    full, rest = divmod(len(raw), 32)
+    out = np.empty(len(raw) + full + (rest > 0), dtype=np.uint8)
+    body = out[:full * 33].reshape(full, 33)
+    body[:, 0] = 31
+    body[:, 1:] = raw[:full * 32].reshape(full, 32)
+    if rest:
+        out[full * 33] = rest - 1
+        out[full * 33 + 1:] = raw[full * 32:]
+    return out.tobytes()
+
+# Write point cloud data to PCD Format (data: ascii, binary, binary_compressed)
+def writePCDFile(fname,x,y,z,i,data="ascii"):
     numPoints= len(x)
-    with open(fname, 'w') as fp:
-        fp.write("VERSION .7\n")
-        fp.write("FIELDS x y z intensity\n")
-        fp.write("SIZE 8 8 8 8\n")
-        fp.write("TYPE F F F F\n")
-        fp.write("COUNT 1 1 1 1\n")
-        fp.write("WIDTH "+str(numPoints)+"\n")
-        fp.write("HEIGHT 1\n")
-        fp.write("VIEWPOINT 0 0 0 1 0 0 0\n")
-        fp.write("POINTS "+str(numPoints)+"\n")
-        fp.write("DATA ascii\n")
-        for index in range(numPoints):
-            txtLine = "{} {} {} {}\n".format(x[index],y[index],z[index], i[index] )
-            fp.write(txtLine)
-        pass
+    header = ("VERSION .7\n"
+              "FIELDS x y z intensity\n"
+              "SIZE 4 4 4 4\n"
+              "TYPE F F F F\n"
+              "COUNT 1 1 1 1\n"
+              "WIDTH {0}\n"
+              "HEIGHT 1\n"
+              "VIEWPOINT 0 0 0 1 0 0 0\n"
+              "POINTS {0}\n"
+              "DATA {1}\n").format(numPoints, data)
+
+    # Interleaved(point-major) float32 array for ascii, binary
+    if data == "ascii" or data == "binary":
+        points = np.empty((numPoints, 4), dtype=np.float32)
+        points[:, 0] = x
+        points[:, 1] = y
+        points[:, 2] = z
+        points[:, 3] = i
+    with open(fname, 'wb') as fp:
+        fp.write(header.encode())
+        if data == "ascii":
+            np.savetxt(fp, points, fmt="%.6g")
+        elif data == "binary":
+            points.tofile(fp)
+        elif data == "binary_compressed":
+            # Field-major float32 array compressed by LZF with compressed / uncompressed size
+            raw = np.concatenate([np.asarray(field, dtype=np.float32) for field in (x, y, z, i)]).tobytes()
+            compressed = lzf.compress(raw) if lzf is not None and len(raw) > 0 else None
+            if compressed is None:
+                compressed = lzfLiteral(raw)
+            fp.write(struct.pack('<II', len(compressed), len(raw)))
+            fp.write(compressed)
+        else:
+            raise ValueError("unknown PCD data type: {}".format(data))
 
 # Write point cloud data to Kitti Format
 def writeKittiFile(_dirs, cnt, _Xyzi):
     kitti_fileName = "{}/kitti{}.bin".format(_dirs, cnt)
-    np_x = np.asarray(_Xyzi)[:,0].astype(np.float32)
-    np_y = np.asarray(_Xyzi)[:,1].astype(np.float32)
-    np_z = np.asarray(_Xyzi)[:,2].astype(np.float32)
-    np_i = np.asarray(_Xyzi)[:,3].astype(np.float32)/256
-    points_32 = np.transpose(np.vstack((np_x, np_y, np_z, np_i)))
+    points_32 = np.array(_Xyzi, dtype=np.float32)
+    points_32[:, 3] /= 256
     points_32.tofile(kitti_fileName)
 
+# ============= Shared Memory Transport ============= #
+# Ring control words: read counter(head), write counter(tail), consumer waiting flag
+RING_HEAD = 0
+RING_TAIL = 1
+RING_WAITING = 2
+RING_CONTROL_SIZE = 64
+RING_SLOT_NUM = 4096
+
+# Lock-free single-producer / single-consumer ring of fixed-size packet slots
+class PacketRing:
+    def __init__(self, slot_num=RING_SLOT_NUM, slot_size=XT_PACKET_SIZE):
+        self.slot_num = slot_num
+        self.slot_size = slot_size
+        size = RING_CONTROL_SIZE + 4 * slot_num + slot_num * slot_size
+        self._shm = shared_memory.SharedMemory(create=True, size=size)
+        self._owner = True
+        self._event = Event()
+        self._attach()
+        self._control[:] = 0
+
+    # Shared memory is attached again by name in the child process
+    def __getstate__(self):
+        return (self._shm.name, self.slot_num, self.slot_size, self._event)
+
+    def __setstate__(self, state):
+        name, self.slot_num, self.slot_size, self._event = state
+        self._shm = shared_memory.SharedMemory(name=name)
+        self._owner = False
+        self._attach()
+
+    def _attach(self):
+        buf = self._shm.buf
+        self._control = np.frombuffer(buf, dtype=np.uint64, count=3)
+        self._length = np.frombuffer(buf, dtype=np.uint32, count=self.slot_num, offset=RING_CONTROL_SIZE)
+        self._slots = buf[RING_CONTROL_SIZE + 4 * self.slot_num:]
+        self.dropped = 0
+
+    def _slot(self, counter):
+        i_slot = int(counter % self.slot_num)
+        return i_slot, self._slots[i_slot * self.slot_size : (i_slot + 1) * self.slot_size]
+
+    def __len__(self):
+        return int(self._control[RING_TAIL] - self._control[RING_HEAD])
+
+    # Producer: writable view of the next free slot (None if ring is full)
+    def reserve(self):
+        tail = self._control[RING_TAIL]
+        if tail - self._control[RING_HEAD] >= self.slot_num:
+            return None
+        return self._slot(tail)[1]
+
+    # Producer: publish the reserved slot and wake the consumer only if it sleeps
+    def commit(self, nbytes):
+        tail = self._control[RING_TAIL]
+        self._length[int(tail % self.slot_num)] = nbytes
+        self._control[RING_TAIL] = tail + 1
+        if self._control[RING_WAITING]:
+            self._event.set()
+
+    # Producer: copy one packet into the ring (packet is dropped if ring is full)
+    def push(self, data):
+        slot = self.reserve()
+        if slot is None:
+            self.dropped += 1
+            return False
+        slot[:len(data)] = data
+        self.commit(len(data))
+        return True
+
+    # Consumer: read-only view of the oldest packet (None if ring is empty)
+    def peek(self):
+        head = self._control[RING_HEAD]
+        if head == self._control[RING_TAIL]:
+            return None
+        i_slot, slot = self._slot(head)
+        return slot[:self._length[i_slot]]
+
+    # Consumer: return the oldest slot to the producer
+    def release(self):
+        self._control[RING_HEAD] += 1
+
+    # Consumer: sleep until packet arrives instead of spinning
+    def wait(self, timeout=None):
+        if self._control[RING_TAIL] != self._control[RING_HEAD]:
+            return True
+        self._event.clear()
+        self._control[RING_WAITING] = 1
+        if self._control[RING_TAIL] == self._control[RING_HEAD]:
+            self._event.wait(timeout)
+        self._control[RING_WAITING] = 0
+        return self._control[RING_TAIL] != self._control[RING_HEAD]
+
+    def close(self):
+        self._control = self._length = None
+        self._slots.release()
+        self._shm.close()
+        if self._owner:
+            self._shm.unlink()
+
+# Double-buffered frame slots in shared memory, only the slot index is handed off through queue
+class SharedFrameBuffer:
+    def __init__(self, shape, dtype=np.uint8, slot_num=2):
+        self.shape = tuple(np.atleast_1d(shape))
+        self.dtype = np.dtype(dtype)
+        self.slot_num = slot_num
+        size = slot_num * int(np.prod(self.shape)) * self.dtype.itemsize
+        self._shm = shared_memory.SharedMemory(create=True, size=size)
+        self._owner = True
+        self._free = Queue()
+        self._ready = Queue()
+        for index in range(slot_num):
+            self._free.put(index)
+        self._attach()
+
+    # Shared memory is attached again by name in the child process
+    def __getstate__(self):
+        return (self._shm.name, self.shape, self.dtype, self.slot_num, self._free, self._ready)
+
+    def __setstate__(self, state):
+        name, self.shape, self.dtype, self.slot_num, self._free, self._ready = state
+        self._shm = shared_memory.SharedMemory(name=name)
+        self._owner = False
+        self._attach()
+
+    def _attach(self):
+        self._slots = np.ndarray((self.slot_num,) + self.shape, dtype=self.dtype, buffer=self._shm.buf)
+        self.dropped = 0
+
+    # Producer: free slot index and writable array (None, None if consumer holds every slot until timeout)
+    # drop_oldest: the oldest frame not yet received by consumer is reclaimed instead of dropping the new one
+    def acquire(self, timeout=0, drop_oldest=False):
+        try:
+            index = self._free.get(timeout != 0, timeout)
+        except queue.Empty:
+            self.dropped += 1
+            if not drop_oldest:
+                return None, None
+            try:
+                # Short wait: frame published by this process may still be in the queue feeder thread
+                index, _ = self._ready.get(timeout=0.001)
+            except queue.Empty:
+                return None, None
+        return index, self._slots[index]
+
+    # Producer: hand off the filled slot with its length along the first axis
+    def publish(self, index, length):
+        self._ready.put((index, length))
+
+    # Consumer: block until frame arrives (None, None on timeout)
+    def receive(self, timeout=None):
+        try:
+            index, length = self._ready.get(timeout=timeout)
+        except queue.Empty:
+            return None, None
+        return index, self._slots[index, :length]
+
+    # Consumer: newest frame only, older ready frames are returned to the producer right away (frame skipping)
+    def latest(self, timeout=None):
+        index, frame = self.receive(timeout)
+        while index is not None:
+            try:
+                newer, length = self._ready.get_nowait()
+            except queue.Empty:
+                break
+            self.release(index)
+            index, frame = newer, self._slots[newer, :length]
+        return index, frame
+
+    # Consumer: slot handed off by index outside of the ready queue
+    def slot(self, index, length):
+        return self._slots[index, :length]
+
+    # Consumer: return the slot to the producer
+    def release(self, index):
+        self._free.put(index)
+
+    def close(self):
+        self._slots = None
+        self._shm.close()
+        if self._owner:
+            self._shm.unlink()
+
+# Bounded queue dropping the oldest item when consumer can't keep up
+class DropOldestQueue:
+    def __init__(self, maxsize=WRITER_QUEUE_SIZE):
+        self._queue = Queue(maxsize)
+        self.dropped = 0
+
+        # Pending items may be lost at exit instead of blocking the producer process
+        # Queue resets the flag in forked / spawned child, so it is set again there once
+        self._queue.cancel_join_thread()
+        register_after_fork(self, DropOldestQueue._afterFork)
+
+    def _afterFork(self):
+        self._queue.cancel_join_thread()
+
+    def __getstate__(self):
+        return (self._queue,)
+
+    def __setstate__(self, state):
+        self._queue, = state
+        self.dropped = 0
+        self._afterFork()
+        register_after_fork(self, DropOldestQueue._afterFork)
+
+    def put(self, item):
+        while 1:
+            try:
+                self._queue.put_nowait(item)
+                return
+            except queue.Full:
+                try:
+                    self._queue.get_nowait()
+                    self.dropped += 1
+                except queue.Empty:
+                    pass
+
+    # Blocking put used for end-of-stream marker
+    def close(self):
+        self._queue.put(None)
+
+    def get(self, timeout=None):
+        return self._queue.get(timeout=timeout)
+
+# ============= Packet Record & Replay ============= #
+# libpcap magic number (microsecond / nanosecond resolution) and link layer header size
+PCAP_MAGIC = {0xa1b2c3d4: 1e-6, 0xa1b23c4d: 1e-9}
+PCAP_LINK_HEADER = {1: 14, 101: 0, 113: 16, 228: 0}
+PCAP_HEADER_SIZE = 24
+PCAP_RECORD_HEADER_SIZE = 16
+UDP_HEADER_SIZE = 8
+PCAP_INDEX_CHUNK = 16384
+
+# Host timestamp(17 bytes, UTC): YYYYMMDDhhmmssfff
+def hostTimestamp(t):
+    return time.strftime("%Y%m%d%H%M%S", time.gmtime(t)).encode() + b"%03d" % int((t % 1) * 1000)
+
+# Host timestamp(N x 17 ASCII digits) to epoch seconds (vectorized)
+def parseHostTimestamp(stamp):
+    digit = stamp.astype(np.int64) - ord('0')
+    def field(a, b):
+        return digit[:, a:b] @ (10 ** np.arange(b - a - 1, -1, -1))
+    days = daysFromCivil(field(0, 4), field(4, 6), field(6, 8))
+    return days * 86400.0 + field(8, 10) * 3600 + field(10, 12) * 60 + field(12, 14) + field(14, 17) * 1e-3
+
+# Append raw packet + host timestamp(1097 bytes) to chunked binary log
+class PacketRecorder:
+    def __init__(self, dirs, chunk_packet=RECORD_CHUNK_PACKET):
+        os.makedirs(dirs, exist_ok=True)
+        self.prefix = os.path.join(dirs, time.strftime("xt32_%Y%m%d_%H%M%S"))
+        self.chunk_packet = chunk_packet
+        self.chunk = 0
+        self.count = 0
+        self._fp = None
+
+    def write(self, record):
+        if self._fp is None or self.count >= self.chunk_packet:
+            self.close()
+            self._fp = open("{}_{:04d}.bin".format(self.prefix, self.chunk), 'wb', buffering=1024 * 1024)
+            self.chunk += 1
+            self.count = 0
+        self._fp.write(record)
+        self.count += 1
+
+    def close(self):
+        if self._fp is not None:
+            self._fp.close()
+            self._fp = None
+
+# Memory-mapped packet source of binary log or libpcap file (UDP payload of 1080 bytes)
+class PacketReplay:
+    def __init__(self, fname, port=None):
+        with open(fname, 'rb') as fp:
+            self._mm = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+        data = np.frombuffer(self._mm, dtype=np.uint8)
+        magic = struct.unpack_from('<I', self._mm, 0)[0] if len(data) >= 4 else 0
+        if magic in PCAP_MAGIC or struct.unpack('>I', struct.pack('<I', magic))[0] in PCAP_MAGIC:
+            self.offsets, self.times = self._indexPcap(data, port)
+        else:
+            # Binary log: fixed-size record of packet + host timestamp
+            records = data[:len(data) // XT_PACKET_SIZE * XT_PACKET_SIZE].reshape(-1, XT_PACKET_SIZE)
+            self.offsets = np.arange(len(records), dtype=np.int64) * XT_PACKET_SIZE
+            self.times = parseHostTimestamp(records[:, XT_DATA_SIZE:XT_PACKET_SIZE])
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def __getitem__(self, i):
+        offset = self.offsets[i]
+        return memoryview(self._mm)[offset : offset + XT_DATA_SIZE]
+
+    # Payload offset and capture time of XT32 packets in pcap
+    # Record headers are walked by runs of the same record length (strided view), payloads are checked at once
+    def _indexPcap(self, data, port):
+        endian = '<' if struct.unpack_from('<I', self._mm, 0)[0] in PCAP_MAGIC else '>'
+        magic, _, _, _, _, _, link = struct.unpack_from(endian + 'IHHiIII', self._mm, 0)
+        resolution = PCAP_MAGIC[magic]
+        link_size = PCAP_LINK_HEADER[link]
+        header = np.dtype([('sec', endian + 'u4'), ('frac', endian + 'u4'), ('incl', endian + 'u4'), ('orig', endian + 'u4')])
+
+        runs = [np.empty(0, dtype=header)]
+        positions = [np.empty(0, dtype=np.int64)]
+        position = PCAP_HEADER_SIZE
+        while position + PCAP_RECORD_HEADER_SIZE <= len(data):
+            incl = struct.unpack_from(endian + 'I', self._mm, position + 8)[0]
+            stride = PCAP_RECORD_HEADER_SIZE + incl
+            count = min(max((len(data) - position) // stride, 1), PCAP_INDEX_CHUNK)
+            records = np.ndarray((count,), dtype=header, buffer=self._mm, offset=position, strides=(stride,))
+            same = records['incl'] == incl
+            run = count if same.all() else int(np.argmin(same))
+            runs.append(records[:run].copy())
+            positions.append(position + np.arange(run, dtype=np.int64) * stride)
+            position += run * stride
+        records = np.concatenate(runs)
+        offsets = np.concatenate(positions) + PCAP_RECORD_HEADER_SIZE
+        incl = records['incl'].astype(np.int64)
+
+        # Truncated last record is skipped
+        payload = self._payloadOffset(data, offsets, incl, link_size, port)
+        valid = (payload >= 0) & (offsets + incl <= len(data))
+        times = records['sec'][valid] + records['frac'][valid] * resolution
+        return offsets[valid] + payload[valid], times
+
+    # Offset of UDP payload from record start (-1 if record is not XT32 packet)
+    @staticmethod
+    def _payloadOffset(data, offsets, incl, link_size, port):
+        last = len(data) - 1
+        ip = np.minimum(offsets + link_size, last)
+        version = data[ip] >> 4
+        ihl = (data[ip] & 0x0F).astype(np.int64) * 4
+        protocol = data[np.minimum(ip + 9, last)]
+        udp = np.minimum(ip + ihl, last - 5)
+        udp_port = data[udp + 2].astype(np.int64) << 8 | data[udp + 3]
+        udp_length = data[udp + 4].astype(np.int64) << 8 | data[udp + 5]
+        valid = (version == 4) & (protocol == 17) & (udp_length == UDP_HEADER_SIZE + XT_DATA_SIZE)
+        valid &= udp + UDP_HEADER_SIZE + XT_DATA_SIZE <= offsets + incl
+        if port is not None:
+            valid &= udp_port == port
+        return np.where(valid, udp + UDP_HEADER_SIZE - offsets, -1)
+
+    def close(self):
+        self._mm.close()
+
+# ============= Synthetic Packet Generator ============= #
+# Head: start of block(0xEEFF), protocol version 6.1, laser number, block number, distance unit(4mm), return number
+XT_HEAD_DEFAULT = np.array([0xEE, 0xFF, 6, 1, 0, 0, XT_UNIT_NUM, XT_BLOCK_NUMBER, 0, 4, 1, 0], dtype=np.uint8)
+XT_FACTORY_INFO = 0x42
+GENERATOR_SCENES = ("room", "random", "empty")
+
+# Room scene: box walls(m) around sensor, floor and ceiling height(m)
+ROOM_HALF_X = 10.0
+ROOM_HALF_Y = 8.0
+ROOM_FLOOR = -1.8
+ROOM_CEILING = 3.0
+
+# Spec-correct XT32 packets of one revolution after another (scene: room, random, empty)
+class PacketGenerator:
+    def __init__(self, motor_speed=XT_MOTOR_SPEED_DEFAULT, return_mode=XT_RETURN_STRONGEST, scene="room", seed=0, start_time=None):
+        assert scene in GENERATOR_SCENES, scene
+        self.motor_speed = motor_speed
+        self.return_mode = return_mode
+        self.scene = scene
+        self.dual = return_mode in XT_DUAL_RETURN
+        self.firing_per_packet = XT_DUAL_BLOCK_SIZE if self.dual else XT_SINGLE_BLOCK_SIZE
+        self.firing_num = XT_FIRING_FREQUENCY * 60 // motor_speed
+        self.packet_num = self.firing_num // self.firing_per_packet
+        self.packet_period = self.firing_per_packet / XT_FIRING_FREQUENCY
+        self.azimuth_step = XT_AZIMUTH_STEP // self.firing_num
+        self.time = time.time() if start_time is None else start_time
+        self.firing = 0
+        self.sequence = 0
+        self._rng = np.random.default_rng(seed)
+        self._elevation = np.deg2rad(V_ANGLE_DEFAULT)
+
+    # Distance(m) and reflectivity of firing azimuth(0.01 deg) x channel
+    def _scene(self, azim):
+        shape = azim.shape + (XT_UNIT_NUM,)
+        if self.scene == "empty":
+            return np.zeros(shape), np.zeros(shape, dtype=np.uint8)
+        if self.scene == "random":
+            return self._rng.uniform(0.5, 100.0, shape), self._rng.integers(0, 256, shape, dtype=np.uint8)
+
+        # Ray and box intersection: nearest of wall x, wall y, floor or ceiling
+        h_angle = np.deg2rad(azim * AZIMUTH_UNIT)[..., np.newaxis]
+        dx = np.abs(np.cos(self._elevation) * np.sin(h_angle)) + 1e-9
+        dy = np.abs(np.cos(self._elevation) * np.cos(h_angle)) + 1e-9
+        dz = np.sin(self._elevation)
+        dz = np.where(dz == 0, 1e-9, dz)
+        t_z = np.where(dz > 0, ROOM_CEILING / dz, ROOM_FLOOR / dz)
+        dist = np.minimum(np.minimum(ROOM_HALF_X / dx, ROOM_HALF_Y / dy), t_z)
+        dist = dist + self._rng.normal(0.0, 0.01, shape)
+        refl = np.where(t_z <= dist, 20, 60) + self._rng.integers(0, 20, shape)
+        return dist, refl.astype(np.uint8)
+
+    # Next count packets as structured array
+    def generate(self, count):
+        packets = np.zeros(count, dtype=XT_PACKET_DTYPE)
+        packets['head'] = XT_HEAD_DEFAULT
+        packets['head'][:, 10] = XT_DUAL_BLOCK_RES if self.dual else XT_SINGLE_BLOCK_RES
+
+        # Azimuth progression of every firing in packet
+        firing = self.firing + np.arange(count * self.firing_per_packet).reshape(count, self.firing_per_packet)
+        azim = (firing * self.azimuth_step) % XT_AZIMUTH_STEP
+        dist, refl = self._scene(azim)
+        raw_dist = np.clip(np.round(dist / DISTANCE_RESOLUTION), 0, 0xFFFF).astype(np.uint16)
+
+        blocks = packets['blocks']
+        if self.dual:
+            # Last return is farther than first / strongest return on part of points (partial occlusion)
+            far = self._rng.random(raw_dist.shape) < 0.2
+            last = np.where(far, np.clip(raw_dist + self._rng.integers(100, 1000, raw_dist.shape), 0, 0xFFFF), raw_dist)
+            value = {"first": raw_dist, "strongest": raw_dist, "last": last.astype(np.uint16)}
+            for parity, name in enumerate(XT_DUAL_RETURN[self.return_mode]):
+                blocks['azimuth'][:, parity::XT_DUAL_BLOCK_RES] = azim
+                blocks['units']['distance'][:, parity::XT_DUAL_BLOCK_RES] = value[name]
+                blocks['units']['reflectivity'][:, parity::XT_DUAL_BLOCK_RES] = refl
+        else:
+            blocks['azimuth'] = azim
+            blocks['units']['distance'] = raw_dist
+            blocks['units']['reflectivity'] = refl
+
+        # Tail: motor speed, timestamp(the last firing of packet), return mode, UTC, sequence
+        t = self.time + np.arange(count) * self.packet_period + (self.firing_per_packet - 1) * XT_FIRING_PERIOD
+        second = np.floor(t).astype('datetime64[s]')
+        day = second.astype('datetime64[D]')
+        month = second.astype('datetime64[M]')
+        sec_day = (second - day).astype(np.int64)
+        tail = packets['tail']
+        tail['motor_speed'] = self.motor_speed
+        tail['timestamp'] = np.round((t - np.floor(t)) * 1e6).clip(0, 999999)
+        tail['return_mode'] = self.return_mode
+        tail['factory'] = XT_FACTORY_INFO
+        tail['utc'][:, 0] = second.astype('datetime64[Y]').astype(np.int64) + 70
+        tail['utc'][:, 1] = month.astype(np.int64) % 12 + 1
+        tail['utc'][:, 2] = (day - month).astype(np.int64) + 1
+        tail['utc'][:, 3] = sec_day // 3600
+        tail['utc'][:, 4] = sec_day // 60 % 60
+        tail['utc'][:, 5] = sec_day % 60
+        tail['sequence'] = (self.sequence + np.arange(count)) & 0xFFFFFFFF
+
+        self.firing += count * self.firing_per_packet
+        self.sequence += count
+        self.time += count * self.packet_period
+        return packets
+
+    # Packets of one revolution
+    def revolution(self):
+        return self.generate(self.packet_num)
+
 # ============= Process Function ============= #
 # Packet Capture
-def capture(port, conn):
-    # Open socket & binding raw data (port: 2368)
+def capture(port, ring, rcvbuf=RCVBUF_SIZE, batch=CAPTURE_BATCH, record_dir=None):
+    # Open socket & binding raw data (port: 2368) with enlarged kernel receive buffer
     soc = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    soc.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, rcvbuf)
     soc.bind(('', port))
+    soc.setblocking(False)
+
+    # Scratch slot to drain socket while ring is full
+    scratch = memoryview(bytearray(ring.slot_size))
+    counter = SequenceCounter()
+    recorder = PacketRecorder(record_dir) if record_dir is not None else None
+    malformed = 0
+    ring_full = 0
+    Time = time.monotonic()
+
+    # Print packet loss accounting
+    def report():
+        print(f"received: {counter.received} dropped: {counter.dropped} reordered: {counter.reordered} "
+              f"duplicated: {counter.duplicated} restarted: {counter.restarted} malformed: {malformed} ring_full: {ring_full}")
+
     try:
         while 1:
-            # send raw data through UDP protocol communication
-            try:
-                data = soc.recv(2000)
-                if len(data) > 0:
-                    assert len(data) == 1080, len(data)
-                    conn.send(data)
-                    
-            except Exception as e:
-                print(dir(e), e.message, e.__class__.__name__)
-                traceback.print_exc(e)
+            # Sleep until socket is readable
+            select.select([soc], [], [], 1.0)
+
+            # Drain socket in batch directly into ring slots through UDP protocol communication
+            for _ in range(batch):
+                slot = ring.reserve()
+                if slot is None:
+                    slot = scratch
+                try:
+                    nbytes = soc.recv_into(slot, ring.slot_size)
+                except BlockingIOError:
+                    break
+                except OSError:
+                    # Oversized datagram (WSAEMSGSIZE on Windows)
+                    malformed += 1
+                    continue
+                except Exception:
+                    traceback.print_exc()
+                    continue
+
+                if nbytes != XT_DATA_SIZE:
+                    malformed += 1
+                    continue
+                counter.update(int.from_bytes(slot[XT_SEQUENCE_OFFSET : XT_DATA_SIZE], 'little'))
+
+                # Record packet with host timestamp appended in the same slot
+                if recorder is not None:
+                    slot[XT_DATA_SIZE : XT_PACKET_SIZE] = hostTimestamp(time.time())
+                    recorder.write(slot[:XT_PACKET_SIZE])
+                if slot is scratch:
+                    ring_full += 1
+                    continue
+                ring.commit(nbytes)
+
+            # Report every second
+            if time.monotonic() - Time >= 1.0:
+                report()
+                Time = time.monotonic()
 
     except KeyboardInterrupt as e:
         print(e)
+        report()
+    finally:
+        if recorder is not None:
+            recorder.close()
 
-# Save Frame Binary Data
-def save_data(shared_data, conn):
+# Packet Replay from binary log or pcap (rate: 1.0 real-time, k scaled, 0 as fast as possible)
+def replay(paths, ring, rate=1.0, port=None):
     try:
-        # Definition of buffer to byte array
-        buffer = bytearray(XT_DATA_SIZE)
+        Time = None
+        for fname in paths:
+            source = PacketReplay(fname, port)
+            for i in range(len(source)):
+                # Wait until capture time of packet scaled by rate
+                if rate > 0:
+                    if Time is None:
+                        Time = time.monotonic() - source.times[i] / rate
+                    delay = Time + source.times[i] / rate - time.monotonic()
+                    if delay > 0.001:
+                        time.sleep(delay)
 
-        # Definition time
-        Time = time.monotonic()
+                # Replay is lossless: wait for downstream stage when ring is full
+                slot = ring.reserve()
+                while slot is None:
+                    time.sleep(0.0005)
+                    slot = ring.reserve()
+                slot[:XT_DATA_SIZE] = source[i]
+                ring.commit(XT_DATA_SIZE)
+            print(f"replay: {fname} packets: {len(source)}")
+            source.close()
+
+    except KeyboardInterrupt as e:
+        print(e)
+
+# Stand-in sensor sending synthetic packets over UDP (rate: 1.0 real-time, k scaled, 0 as fast as possible)
+def emulator(port, host="127.0.0.1", motor_speed=XT_MOTOR_SPEED_DEFAULT, return_mode=XT_RETURN_STRONGEST, scene="room", rate=1.0, revolutions=None):
+    soc = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    generator = PacketGenerator(motor_speed, return_mode, scene)
+    count = 0
+    Time = time.monotonic()
+    try:
+        while revolutions is None or count < revolutions * generator.packet_num:
+            data = memoryview(generator.revolution().tobytes())
+            for i in range(generator.packet_num):
+                # Wait until send time of packet scaled by rate
+                if rate > 0:
+                    delay = Time + count * generator.packet_period / rate - time.monotonic()
+                    if delay > 0.001:
+                        time.sleep(delay)
+                soc.sendto(data[i * XT_DATA_SIZE : (i + 1) * XT_DATA_SIZE], (host, port))
+                count += 1
+
+    except KeyboardInterrupt as e:
+        print(e)
+    finally:
+        soc.close()
+
+# Save Frame Binary Data
+def save_data(ring, frames, cut_angle=0.0, lossless=False):
+    try:
+        # Definition of frame assembler cutting at azimuth wraparound
+        assembler = FrameAssembler(cut_angle)
 
         # While Loop
         while 1:
-            # shared memory polling to get data
-            if conn.poll():
-                # Receive Data from Packet
-                data = conn.recv()
-
-                # Buffer Accumulate until 10Hz(0.1s) = 1 Frame
-                buffer += data
-            
-            # Send LiDAR frame data to check time 0.1s(10Hz)
-            if time.monotonic() - Time >= 0.1:
-                # Send to Shared Memory
-                shared_data[1].send(buffer)
-                
-                # Initialization buffer & time
-                buffer = bytearray(XT_DATA_SIZE)
-                Time = time.monotonic()
+            # Sleep until packet arrives
+            if not ring.wait(1.0):
+                continue
+
+            # Receive Data from Packet and accumulate until azimuth wraps = 1 Frame
+            frame = assembler.push(ring.peek())
+            ring.release()
+
+            # Hand off slot index of frame in shared memory (frame is dropped if no free slot unless lossless)
+            if frame is not None:
+                index, buffer = frames.acquire(None if lossless else 0)
+                if buffer is not None:
+                    buffer[:len(frame)] = frame
+                    frames.publish(index, len(frame))
                 
     except KeyboardInterrupt as e:
         print(e)
 
 # Unpacking LiDAR Binary Data in frame
-def unpack(shared_data, shared_XYZI):
-    # Definition raw data
-    raw_data = []
+def unpack(frames, points, calibration_file=None, writer_queue=None, returns="all", motion=None, pose_queue=None,
+           point_filter=None, voxel_size=None, organized=False):
+    # Range filter only by default
+    if point_filter is None:
+        point_filter = PolarFilter()
+
+    # Pose stream is appended to pose trajectory only
+    if pose_queue is not None:
+        if motion is None:
+            motion = PoseTrajectory()
+        if not isinstance(motion, PoseTrajectory):
+            raise ValueError("pose_queue requires PoseTrajectory motion, not {}".format(type(motion).__name__))
+
+    # Direction and intensity lookup table
+    calibration = Calibration(calibration_file)
     Time = time.monotonic()
 
     # While Loop
     while 1:
-        # Polling shared data
-        if shared_data[0].poll():
-            raw_data = shared_data[0].recv()
-
-            # Calculate number of packet
-            N = len(raw_data) / 1080
-
-            # Definition Azimuth, Distance, Reflection, Channel Array
-            int_azim_0 = np.empty(int(XT_MAX_POINT_SIZE * N), dtype=np.uint8)
-            int_azim_1 = np.empty(int(XT_MAX_POINT_SIZE * N), dtype=np.uint8)
-            int_dist_0 = np.empty(int(XT_MAX_POINT_SIZE * N), dtype=np.uint8)
-            int_dist_1 = np.empty(int(XT_MAX_POINT_SIZE * N), dtype=np.uint8)
-            int_refl   = np.empty(int(XT_MAX_POINT_SIZE * N), dtype=np.uint8)
-
-            # For Loop to slice azimuth, distance, reflection
-            for i in np.arange(0, N):
-                i_pck = int(XT_DATA_SIZE * i)
-                body = raw_data[i_pck + XT_HEAD_SIZE : i_pck + XT_HEAD_SIZE + XT_BODY_SIZE]
-                i_bin = int(XT_MAX_POINT_SIZE * i)
-
-                # Azimuth, Distance, Reflection Frame Packet Store 
-                int_azim_0[i_bin : i_bin + XT_MAX_POINT_SIZE] = [body[0],body[0],body[0],body[0],body[0],body[0],body[0],body[0],body[0],body[0],body[0],body[0],body[0],body[0],body[0],body[0],body[0],body[0],body[0],body[0],body[0],body[0],body[0],body[0],body[0],body[0],body[0],body[0],body[0],body[0],body[0],body[0],\
-                                                                 body[130],body[130],body[130],body[130],body[130],body[130],body[130],body[130],body[130],body[130],body[130],body[130],body[130],body[130],body[130],body[130],body[130],body[130],body[130],body[130],body[130],body[130],body[130],body[130],body[130],body[130],body[130],body[130],body[130],body[130],body[130],body[130],\
-                                                                    body[260],body[260],body[260],body[260],body[260],body[260],body[260],body[260],body[260],body[260],body[260],body[260],body[260],body[260],body[260],body[260],body[260],body[260],body[260],body[260],body[260],body[260],body[260],body[260],body[260],body[260],body[260],body[260],body[260],body[260],body[260],body[260],\
-                                                                        body[390],body[390],body[390],body[390],body[390],body[390],body[390],body[390],body[390],body[390],body[390],body[390],body[390],body[390],body[390],body[390],body[390],body[390],body[390],body[390],body[390],body[390],body[390],body[390],body[390],body[390],body[390],body[390],body[390],body[390],body[390],body[390],\
-                                                                            body[520],body[520],body[520],body[520],body[520],body[520],body[520],body[520],body[520],body[520],body[520],body[520],body[520],body[520],body[520],body[520],body[520],body[520],body[520],body[520],body[520],body[520],body[520],body[520],body[520],body[520],body[520],body[520],body[520],body[520],body[520],body[520],\
-                                                                                body[650],body[650],body[650],body[650],body[650],body[650],body[650],body[650],body[650],body[650],body[650],body[650],body[650],body[650],body[650],body[650],body[650],body[650],body[650],body[650],body[650],body[650],body[650],body[650],body[650],body[650],body[650],body[650],body[650],body[650],body[650],body[650],\
-                                                                                    body[780],body[780],body[780],body[780],body[780],body[780],body[780],body[780],body[780],body[780],body[780],body[780],body[780],body[780],body[780],body[780],body[780],body[780],body[780],body[780],body[780],body[780],body[780],body[780],body[780],body[780],body[780],body[780],body[780],body[780],body[780],body[780],\
-                                                                                        body[910],body[910],body[910],body[910],body[910],body[910],body[910],body[910],body[910],body[910],body[910],body[910],body[910],body[910],body[910],body[910],body[910],body[910],body[910],body[910],body[910],body[910],body[910],body[910],body[910],body[910],body[910],body[910],body[910],body[910],body[910],body[910]]
-                
-                int_azim_1[i_bin : i_bin + XT_MAX_POINT_SIZE] = [body[1],body[1],body[1],body[1],body[1],body[1],body[1],body[1],body[1],body[1],body[1],body[1],body[1],body[1],body[1],body[1],body[1],body[1],body[1],body[1],body[1],body[1],body[1],body[1],body[1],body[1],body[1],body[1],body[1],body[1],body[1],body[1],\
-                                                                 body[131],body[131],body[131],body[131],body[131],body[131],body[131],body[131],body[131],body[131],body[131],body[131],body[131],body[131],body[131],body[131],body[131],body[131],body[131],body[131],body[131],body[131],body[131],body[131],body[131],body[131],body[131],body[131],body[131],body[131],body[131],body[131],\
-                                                                    body[261],body[261],body[261],body[261],body[261],body[261],body[261],body[261],body[261],body[261],body[261],body[261],body[261],body[261],body[261],body[261],body[261],body[261],body[261],body[261],body[261],body[261],body[261],body[261],body[261],body[261],body[261],body[261],body[261],body[261],body[261],body[261],\
-                                                                        body[391],body[391],body[391],body[391],body[391],body[391],body[391],body[391],body[391],body[391],body[391],body[391],body[391],body[391],body[391],body[391],body[391],body[391],body[391],body[391],body[391],body[391],body[391],body[391],body[391],body[391],body[391],body[391],body[391],body[391],body[391],body[391],\
-                                                                            body[521],body[521],body[521],body[521],body[521],body[521],body[521],body[521],body[521],body[521],body[521],body[521],body[521],body[521],body[521],body[521],body[521],body[521],body[521],body[521],body[521],body[521],body[521],body[521],body[521],body[521],body[521],body[521],body[521],body[521],body[521],body[521],\
-                                                                                body[651],body[651],body[651],body[651],body[651],body[651],body[651],body[651],body[651],body[651],body[651],body[651],body[651],body[651],body[651],body[651],body[651],body[651],body[651],body[651],body[651],body[651],body[651],body[651],body[651],body[651],body[651],body[651],body[651],body[651],body[651],body[651],\
-                                                                                    body[781],body[781],body[781],body[781],body[781],body[781],body[781],body[781],body[781],body[781],body[781],body[781],body[781],body[781],body[781],body[781],body[781],body[781],body[781],body[781],body[781],body[781],body[781],body[781],body[781],body[781],body[781],body[781],body[781],body[781],body[781],body[781],\
-                                                                                        body[911],body[911],body[911],body[911],body[911],body[911],body[911],body[911],body[911],body[911],body[911],body[911],body[911],body[911],body[911],body[911],body[911],body[911],body[911],body[911],body[911],body[911],body[911],body[911],body[911],body[911],body[911],body[911],body[911],body[911],body[911],body[911]]
-                
-                int_dist_0[i_bin : i_bin+XT_MAX_POINT_SIZE] = [body[2],body[6],body[10],body[14],body[18],body[22],body[26],body[30],body[34],body[38],body[42],body[46],body[50],body[54],body[58],body[62],body[66],body[70],body[74],body[78],body[82],body[86],body[90],body[94],body[98],body[102],body[106],body[110],body[114],body[118],body[122],body[126],\
-                                                               body[132],body[136],body[140],body[144],body[148],body[152],body[156],body[160],body[164],body[168],body[172],body[176],body[180],body[184],body[188],body[192],body[196],body[200],body[204],body[208],body[212],body[216],body[220],body[224],body[228],body[232],body[236],body[240],body[244],body[248],body[252],body[256],\
-                                                                body[262],body[266],body[270],body[274],body[278],body[282],body[286],body[290],body[294],body[298],body[302],body[306],body[310],body[314],body[318],body[322],body[326],body[330],body[334],body[338],body[342],body[346],body[350],body[354],body[358],body[362],body[366],body[370],body[374],body[378],body[382],body[386],\
-                                                                    body[392],body[396],body[400],body[404],body[408],body[412],body[416],body[420],body[424],body[428],body[432],body[436],body[440],body[444],body[448],body[452],body[456],body[460],body[464],body[468],body[472],body[476],body[480],body[484],body[488],body[492],body[496],body[500],body[504],body[508],body[512],body[516],\
-                                                                        body[522],body[526],body[530],body[534],body[538],body[542],body[546],body[550],body[554],body[558],body[562],body[566],body[570],body[574],body[578],body[582],body[586],body[590],body[594],body[598],body[602],body[606],body[610],body[614],body[618],body[622],body[626],body[630],body[634],body[638],body[642],body[646],\
-                                                                            body[652],body[656],body[660],body[664],body[668],body[672],body[676],body[680],body[684],body[688],body[692],body[696],body[700],body[704],body[708],body[712],body[716],body[720],body[724],body[728],body[732],body[736],body[740],body[744],body[748],body[752],body[756],body[760],body[764],body[768],body[772],body[776],\
-                                                                                body[782],body[786],body[790],body[794],body[798],body[802],body[806],body[810],body[814],body[818],body[822],body[826],body[830],body[834],body[838],body[842],body[846],body[850],body[854],body[858],body[862],body[866],body[870],body[874],body[878],body[882],body[886],body[890],body[894],body[898],body[902],body[906],\
-                                                                                    body[912],body[916],body[920],body[924],body[928],body[932],body[936],body[940],body[944],body[948],body[952],body[956],body[960],body[964],body[968],body[972],body[976],body[980],body[984],body[988],body[992],body[996],body[1000],body[1004],body[1008],body[1012],body[1016],body[1020],body[1024],body[1028],body[1032],body[1036]]
-                
-                int_dist_1[i_bin : i_bin+XT_MAX_POINT_SIZE] = [body[3],body[7],body[11],body[15],body[19],body[23],body[27],body[31],body[35],body[39],body[43],body[47],body[51],body[55],body[59],body[63],body[67],body[71],body[75],body[79],body[83],body[87],body[91],body[95],body[99],body[103],body[107],body[111],body[115],body[119],body[123],body[127],\
-                                                               body[133],body[137],body[141],body[145],body[149],body[153],body[157],body[161],body[165],body[169],body[173],body[177],body[181],body[185],body[189],body[193],body[197],body[201],body[205],body[209],body[213],body[217],body[221],body[225],body[229],body[233],body[237],body[241],body[245],body[249],body[253],body[257],\
-                                                                body[263],body[267],body[271],body[275],body[279],body[283],body[287],body[291],body[295],body[299],body[303],body[307],body[311],body[315],body[319],body[323],body[327],body[331],body[335],body[339],body[343],body[347],body[351],body[355],body[359],body[363],body[367],body[371],body[375],body[379],body[383],body[387],\
-                                                                    body[393],body[397],body[401],body[405],body[409],body[413],body[417],body[421],body[425],body[429],body[433],body[437],body[441],body[445],body[449],body[453],body[457],body[461],body[465],body[469],body[473],body[477],body[481],body[485],body[489],body[493],body[497],body[501],body[505],body[509],body[513],body[517],\
-                                                                        body[523],body[527],body[531],body[535],body[539],body[543],body[547],body[551],body[555],body[559],body[563],body[567],body[571],body[575],body[579],body[583],body[587],body[591],body[595],body[599],body[603],body[607],body[611],body[615],body[619],body[623],body[627],body[631],body[635],body[639],body[643],body[647],\
-                                                                            body[653],body[657],body[661],body[665],body[669],body[673],body[677],body[681],body[685],body[689],body[693],body[697],body[701],body[705],body[709],body[713],body[717],body[721],body[725],body[729],body[733],body[737],body[741],body[745],body[749],body[753],body[757],body[761],body[765],body[769],body[773],body[777],\
-                                                                                body[783],body[787],body[791],body[795],body[799],body[803],body[807],body[811],body[815],body[819],body[823],body[827],body[831],body[835],body[839],body[843],body[847],body[851],body[855],body[859],body[863],body[867],body[871],body[875],body[879],body[883],body[887],body[891],body[895],body[899],body[903],body[907],\
-                                                                                    body[913],body[917],body[921],body[925],body[929],body[933],body[937],body[941],body[945],body[949],body[953],body[957],body[961],body[965],body[969],body[973],body[977],body[981],body[985],body[989],body[993],body[997],body[1001],body[1005],body[1009],body[1013],body[1017],body[1021],body[1025],body[1029],body[1033],body[1037]]
-                
-                int_refl[i_bin : i_bin+XT_MAX_POINT_SIZE] = [body[4],body[8],body[12],body[16],body[20],body[24],body[28],body[32],body[36],body[40],body[44],body[48],body[52],body[56],body[60],body[64],body[68],body[72],body[76],body[80],body[84],body[88],body[92],body[96],body[100],body[104],body[108],body[112],body[116],body[120],body[124],body[128],\
-                                                             body[134],body[138],body[142],body[146],body[150],body[154],body[158],body[162],body[166],body[170],body[174],body[178],body[182],body[186],body[190],body[194],body[198],body[202],body[206],body[210],body[214],body[218],body[222],body[226],body[230],body[234],body[238],body[242],body[246],body[250],body[254],body[258],\
-                                                                body[264],body[268],body[272],body[276],body[280],body[284],body[288],body[292],body[296],body[300],body[304],body[308],body[312],body[316],body[320],body[324],body[328],body[332],body[336],body[340],body[344],body[348],body[352],body[356],body[360],body[364],body[368],body[372],body[376],body[380],body[384],body[388],\
-                                                                    body[394],body[398],body[402],body[406],body[410],body[414],body[418],body[422],body[426],body[430],body[434],body[438],body[442],body[446],body[450],body[454],body[458],body[462],body[466],body[470],body[474],body[478],body[482],body[486],body[490],body[494],body[498],body[502],body[506],body[510],body[514],body[518],\
-                                                                        body[524],body[528],body[532],body[536],body[540],body[544],body[548],body[552],body[556],body[560],body[564],body[568],body[572],body[576],body[580],body[584],body[588],body[592],body[596],body[600],body[604],body[608],body[612],body[616],body[620],body[624],body[628],body[632],body[636],body[640],body[644],body[648],\
-                                                                            body[654],body[658],body[662],body[666],body[670],body[674],body[678],body[682],body[686],body[690],body[694],body[698],body[702],body[706],body[710],body[714],body[718],body[722],body[726],body[730],body[734],body[738],body[742],body[746],body[750],body[754],body[758],body[762],body[766],body[770],body[774],body[778],\
-                                                                                body[784],body[788],body[792],body[796],body[800],body[804],body[808],body[812],body[816],body[820],body[824],body[828],body[832],body[836],body[840],body[844],body[848],body[852],body[856],body[860],body[864],body[868],body[872],body[876],body[880],body[884],body[888],body[892],body[896],body[900],body[904],body[908],\
-                                                                                    body[914],body[918],body[922],body[926],body[930],body[934],body[938],body[942],body[946],body[950],body[954],body[958],body[962],body[966],body[970],body[974],body[978],body[982],body[986],body[990],body[994],body[998],body[1002],body[1006],body[1010],body[1014],body[1018],body[1022],body[1026],body[1030],body[1034],body[1038]]
-            # Unpacking Azimuth, Range, Reflection to use buffer    
-            azim = (np.uint16(int_azim_1) << 8) | int_azim_0
-            range = (np.uint16(int_dist_1) << 8) | int_dist_0
-
-            # Find the index of an array with a nonzero value
-            i_valid = np.where(range != 0)
-
-            # Transformation azimuth, vertical angle, range, reflection through specification about HESAI XT32 (AZIMUTH UNIT: 0.01, DISTANCE_RESOLUTION: 0.004)
-            azim = np.deg2rad(azim[i_valid] * AZIMUTH_UNIT)
-            v_angle = np.deg2rad(V_ANGLE_GLB[i_valid])
-            range = range[i_valid] * DISTANCE_RESOLUTION
-            int_refl = int_refl[i_valid]
-
-            # Calculation X, Y, Z, I to use matrix element product
-            X = np.multiply(range, np.multiply(np.cos(v_angle), np.sin(azim)))
-            Y = np.multiply(range, np.multiply(np.cos(v_angle), np.cos(azim)))
-            Z = np.multiply(range, np.sin(v_angle))
-            I = int_refl
-
-            # non-linear intensity mapping
-            I = np.vectorize(REFLECT_MAP.get)(I)
-            
-            # Transposition about X, Y, Z to XYZ array (:, 3)
-            points_32 = np.transpose(np.vstack((X, Y, Z, I)))
-
-            # Send XYZ Data using multiprocessing.Pipe()
-            shared_XYZI[1].send(points_32)
-
-            # Print the point size and del time
-            print(f"point_size: {len(points_32)} del_time: {time.monotonic() - Time}")
-
-            # Time Update
-            Time = time.monotonic()
-
-# Visualization Point Cloud Data to BEV(bird eye view)    
-def visualization(shared_XYZI):
-    # X, Y, Z, I Definition
-    Xyzi = np.empty((0,4), dtype=np.float32)
-    np_x = np.asarray(Xyzi)[:,0].astype(np.float32)
-    np_y = np.asarray(Xyzi)[:,1].astype(np.float32)
+        # Sleep until frame arrives
+        index, raw_data = frames.receive()
+
+        # Decode Azimuth, Range, Reflection of the whole frame through the structured packet view
+        azim, range, int_refl = decodeFrame(raw_data, returns)
+
+        # Find the index of points passing polar filter (zero range is invalid) before projection
+        i_valid = point_filter.apply(azim, range, int_refl, firingBlocks(packetView(raw_data), returns))
+        azim = azim[i_valid]
+        channel = i_valid % XT_UNIT_NUM
+        range = range[i_valid]
+        int_refl = int_refl[i_valid]
+
+        # Per-point timestamp for motion compensation
+        if motion is not None:
+            times = decodeTimes(raw_data, returns)[i_valid]
+
+        # Column number of range image from motor speed in packet tail
+        if organized:
+            width = imageWidth(int(packetView(raw_data)['tail']['motor_speed'][0]), point_filter.column_stride)
+
+        # Frame slot can be reused by save_data
+        frames.release(index)
+
+        # Write X, Y, Z, I to point slot (:, 4) in shared memory (viewer skips the frame if it holds every slot)
+        index, points_32 = points.acquire() if not organized else (None, None)
+        Xyzi = calibration.project(azim, channel, range, int_refl, out=points_32)
+
+        # De-skew to the time of the last point with latest ego poses
+        if motion is not None:
+            while pose_queue is not None and not pose_queue.empty():
+                motion.append(*pose_queue.get())
+            deskew(Xyzi, times, motion)
 
+        # Organized range image to image slot instead of flat point list
+        if organized:
+            index, image_32 = points.acquire()
+            if image_32 is not None:
+                rangeImage(azim, channel, range, Xyzi, width, out=image_32)
+                points.publish(index, XT_UNIT_NUM * width * XT_IMAGE_FIELD)
+
+        # Voxel grid downsampling after projection
+        if voxel_size is not None:
+            Xyzi = voxelDownsample(Xyzi, voxel_size)
+            if points_32 is not None:
+                points_32[:len(Xyzi)] = Xyzi
+        if points_32 is not None:
+            points.publish(index, len(Xyzi))
+
+        # Copy of frame to writer process (oldest frame is dropped if disk can't keep up)
+        if writer_queue is not None:
+            writer_queue.put(Xyzi.copy() if points_32 is not None and voxel_size is None else Xyzi)
+
+        # Print the point size and del time
+        print(f"point_size: {len(Xyzi)} del_time: {time.monotonic() - Time}")
+
+        # Time Update
+        Time = time.monotonic()
+
+# Save Point Cloud Data to PCD or Kitti file in background (writer_queue: DropOldestQueue or SharedFrameBuffer)
+def writer(writer_queue, dirs, fmt="kitti", data="binary"):
+    os.makedirs(dirs, exist_ok=True)
+    cnt = 0
+    try:
+        while 1:
+            if isinstance(writer_queue, SharedFrameBuffer):
+                index, Xyzi = writer_queue.receive()
+            else:
+                index, Xyzi = None, writer_queue.get()
+            if Xyzi is None:
+                break
+            if fmt == "kitti":
+                writeKittiFile(dirs, cnt, Xyzi)
+            else:
+                writePCDFile("{}/pcd{}.pcd".format(dirs, cnt), Xyzi[:, 0], Xyzi[:, 1], Xyzi[:, 2], Xyzi[:, 3], data)
+            if index is not None:
+                writer_queue.release(index)
+            cnt += 1
+    except KeyboardInterrupt as e:
+        print(e)
+
+# Rasterize points to BEV image (pixel x pixel): occupancy or mean intensity per cell
+def bevImage(x, y, intensity, view_range=VIEW_RANGE, pixel=VIEW_PIXEL, mode="intensity"):
+    scale = pixel / (2 * view_range)
+    ix = np.floor((x + view_range) * scale).astype(np.int64)
+    iy = np.floor((y + view_range) * scale).astype(np.int64)
+    inside = (ix >= 0) & (ix < pixel) & (iy >= 0) & (iy < pixel)
+    cell = iy[inside] * pixel + ix[inside]
+    count = np.bincount(cell, minlength=pixel * pixel)
+    if mode == "occupancy":
+        image = (count > 0).astype(np.float32)
+    else:
+        image = (np.bincount(cell, weights=intensity[inside], minlength=pixel * pixel) / np.maximum(count, 1)).astype(np.float32)
+    return image.reshape(pixel, pixel)
+
+# Visualization Point Cloud Data to BEV(bird eye view) image with blitting
+# Only the newest frame is drawn and its slot is returned right after rasterizing, so the viewer never blocks unpack
+def visualization(points, organized=False, view_range=VIEW_RANGE, mode="intensity"):
     # Visualization Specification
-    _, ax = plt.subplots()
-    sc = ax.scatter(np_x, np_y, s=0.01)
-    plt.xlim([-3, 3])
-    plt.ylim([-3, 3])
-    plt.draw()
-
-    # Data Update Function
-    def update_point_cloud(_Xyzi):
-        new_point_cloud = _Xyzi[:, 0:2]
-        sc.set_offsets(new_point_cloud)
-        plt.pause(0.01)
+    fig, ax = plt.subplots()
+    bev = ax.imshow(np.zeros((VIEW_PIXEL, VIEW_PIXEL), dtype=np.float32), origin='lower', cmap='gray', interpolation='nearest',
+                    extent=(-view_range, view_range, -view_range, view_range), vmin=0, vmax=1 if mode == "occupancy" else 255, animated=True)
+    plt.show(block=False)
+
+    # Background without BEV image, captured again whenever the figure is fully redrawn (e.g. resize)
+    background = [None]
+    def on_draw(event):
+        background[0] = fig.canvas.copy_from_bbox(ax.bbox)
+        ax.draw_artist(bev)
+    fig.canvas.mpl_connect('draw_event', on_draw)
+    fig.canvas.draw()
+
+    while plt.fignum_exists(fig.number):
+        # Receive the newest frame without blocking the GUI event loop (older frames are skipped)
+        index, data = points.latest(timeout=0.01)
+
+        # Decimate to point budget so that display cost is constant regardless of point number
+        if data is not None:
+            if organized:
+                cloud = data.reshape(XT_UNIT_NUM, -1, XT_IMAGE_FIELD)
+                step = -(-cloud.shape[1] * XT_UNIT_NUM // VIEW_MAX_POINT)
+                cloud = cloud[:, ::step].reshape(-1, XT_IMAGE_FIELD)
+                cloud = cloud[cloud[:, 0] > 0]
+                image = bevImage(cloud[:, 2], cloud[:, 3], cloud[:, 1], view_range, mode=mode)
+            else:
+                step = max(-(-len(data) // VIEW_MAX_POINT), 1)
+                image = bevImage(data[::step, 0], data[::step, 1], data[::step, 3], view_range, mode=mode)
+            points.release(index)
+
+            # Redraw only the BEV image over the saved background
+            fig.canvas.restore_region(background[0])
+            bev.set_data(image)
+            ax.draw_artist(bev)
+            fig.canvas.blit(ax.bbox)
+        fig.canvas.flush_events()
+
+
+# ============= Multi-Sensor Pipeline ============= #
+DECODE_WORKER_NUM = 2
+MERGE_TOLERANCE = 0.05
+
+# Sensor: port, source IP, calibration CSV, extrinsic transform(4 x 4) to vehicle frame
+class SensorConfig:
+    def __init__(self, port=PORT, host=None, calibration=None, extrinsic=None, cut_angle=0.0, returns="all",
+                 point_filter=None, voxel_size=None):
+        self.port = port
+        self.host = host
+        self.calibration = calibration
+        self.extrinsic = np.eye(4) if extrinsic is None else np.asarray(extrinsic, dtype=np.float64)
+        self.cut_angle = cut_angle
+        self.returns = returns
+        self.point_filter = PolarFilter() if point_filter is None else point_filter
+        self.voxel_size = voxel_size
+
+# Capture and frame assembly of one sensor, completed frame is handed to decode worker pool by slot index
+def sensor_capture(sensor_id, config, frames, task_queue, rcvbuf=RCVBUF_SIZE, batch=CAPTURE_BATCH):
+    soc = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    soc.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, rcvbuf)
+    soc.bind(('', config.port))
+    soc.setblocking(False)
+
+    slot = memoryview(bytearray(XT_PACKET_SIZE))
+    assembler = FrameAssembler(config.cut_angle)
+    counter = SequenceCounter()
+    malformed = 0
+    try:
+        while 1:
+            # Sleep until socket is readable
+            select.select([soc], [], [], 1.0)
+
+            # Drain socket in batch and assemble frame
+            for _ in range(batch):
+                try:
+                    nbytes, address = soc.recvfrom_into(slot, XT_PACKET_SIZE)
+                except BlockingIOError:
+                    break
+                except OSError:
+                    malformed += 1
+                    continue
+                if config.host is not None and address[0] != config.host:
+                    continue
+                if nbytes != XT_DATA_SIZE:
+                    malformed += 1
+                    continue
+                counter.update(int.from_bytes(slot[XT_SEQUENCE_OFFSET : XT_DATA_SIZE], 'little'))
+
+                # Frame is dropped if every slot is still in decode worker pool
+                frame = assembler.push(slot)
+                if frame is not None:
+                    index, buffer = frames.acquire()
+                    if buffer is not None:
+                        buffer[:len(frame)] = frame
+                        task_queue.put((sensor_id, index, len(frame)))
+
+    except KeyboardInterrupt as e:
+        print(e)
+    finally:
+        print(f"sensor: {sensor_id} received: {counter.received} dropped: {counter.dropped} "
+              f"reordered: {counter.reordered} duplicated: {counter.duplicated} "
+              f"restarted: {counter.restarted} malformed: {malformed} frame_dropped: {frames.dropped}")
+
+# Decode worker shared by every sensor: X, Y, Z, I in vehicle frame with frame time(the last packet)
+# Cloud is written to point slot of the sensor, only the slot index is handed off through result queue
+def decode_worker(configs, frame_buffers, point_buffers, task_queue, result_queue):
+    calibrations = [Calibration(config.calibration) for config in configs]
+    try:
+        while 1:
+            task = task_queue.get()
+            if task is None:
+                break
+            sensor_id, index, length = task
+            config = configs[sensor_id]
+            raw_data = frame_buffers[sensor_id].slot(index, length)
+
+            # Decode, projection and extrinsic transform
+            azim, dist, refl = decodeFrame(raw_data, config.returns)
+            i_valid = config.point_filter.apply(azim, dist, refl, firingBlocks(packetView(raw_data), config.returns))
+            stamp = packetTime(packetView(raw_data)[-1:])[0]
+
+            # Frame is dropped if the pipeline still holds every point slot of the sensor
+            slot, points_32 = point_buffers[sensor_id].acquire()
+            if points_32 is None:
+                frame_buffers[sensor_id].release(index)
+                continue
+            Xyzi = calibrations[sensor_id].project(azim[i_valid], i_valid % XT_UNIT_NUM, dist[i_valid], refl[i_valid], out=points_32)
+            frame_buffers[sensor_id].release(index)
+            if config.voxel_size is not None:
+                Xyzi = voxelDownsample(Xyzi, config.voxel_size)
+                points_32[:len(Xyzi)] = Xyzi
+                Xyzi = points_32[:len(Xyzi)]
+            Xyzi[:, 0:3] = Xyzi[:, 0:3] @ config.extrinsic[0:3, 0:3].T + config.extrinsic[0:3, 3]
+
+            result_queue.put((sensor_id, slot, len(Xyzi), stamp))
+
+    except KeyboardInterrupt as e:
+        print(e)
+
+# N sensors -> capture / assembly per sensor -> fixed-size decode worker pool -> subscribers
+class XT32Pipeline:
+    def __init__(self, sensors, workers=DECODE_WORKER_NUM, merge_tolerance=MERGE_TOLERANCE):
+        self.sensors = list(sensors)
+        self.workers = workers
+        self.merge_tolerance = merge_tolerance
+        self._frame_buffers = [SharedFrameBuffer(XT_MAX_FRAME_SIZE, np.uint8, slot_num=workers + 2) for _ in self.sensors]
+        # Point slots: one per worker in flight, one held for merge, one spare
+        self._point_buffers = [SharedFrameBuffer((XT_MAX_FRAME_POINT, 4), np.float32, slot_num=workers + 2) for _ in self.sensors]
+        self._task_queue = Queue()
+        self._result_queue = Queue()
+        self._subscribers = []
+        self._latest = {}
+        self._processes = []
+
+    # Subscriber: callback(sensor_id, stamp, Xyzi), DropOldestQueue or SharedFrameBuffer (merged: time-aligned cloud of every sensor)
+    # Xyzi of callback is a view of shared point slot, valid only during the call
+    def subscribe(self, subscriber, merged=False):
+        self._subscribers.append((subscriber, merged))
+        return subscriber
+
+    def start(self):
+        for sensor_id, config in enumerate(self.sensors):
+            self._processes.append(Process(target = sensor_capture, args = (sensor_id, config, self._frame_buffers[sensor_id], self._task_queue)))
+        for _ in range(self.workers):
+            self._processes.append(Process(target = decode_worker, args = (self.sensors, self._frame_buffers, self._point_buffers, self._task_queue, self._result_queue)))
+        for process in self._processes:
+            process.start()
+
+    # Fan out decoded cloud to subscribers
+    def _publish(self, sensor_id, stamp, Xyzi, merged):
+        for subscriber, want_merged in self._subscribers:
+            if want_merged != merged:
+                continue
+            if isinstance(subscriber, DropOldestQueue):
+                subscriber.put(Xyzi)
+            elif isinstance(subscriber, SharedFrameBuffer):
+                # Drop oldest like DropOldestQueue when the viewer / writer falls behind
+                index, buffer = subscriber.acquire(drop_oldest=True)
+                if buffer is not None:
+                    buffer[:len(Xyzi)] = Xyzi[:len(buffer)]
+                    subscriber.publish(index, min(len(Xyzi), len(buffer)))
+            else:
+                subscriber(sensor_id, stamp, Xyzi)
+
+    # Merge the latest frames of every sensor when their times are within tolerance (point slot is held until then)
+    def _merge(self, sensor_id, slot, stamp, Xyzi):
+        if sensor_id in self._latest:
+            self._point_buffers[sensor_id].release(self._latest[sensor_id][0])
+        self._latest[sensor_id] = (slot, stamp, Xyzi)
+        if len(self._latest) < len(self.sensors):
+            return
+        stamps = [latest[1] for latest in self._latest.values()]
+        if max(stamps) - min(stamps) <= self.merge_tolerance:
+            merged = np.vstack([self._latest[i][2] for i in range(len(self.sensors))])
+            for i, (held, _, _) in self._latest.items():
+                self._point_buffers[i].release(held)
+            self._latest.clear()
+            self._publish(-1, max(stamps), merged, True)
+
+    # Receive decoded clouds and publish them until stopped
+    def run(self, timeout=None):
+        start = time.monotonic()
+        try:
+            while timeout is None or time.monotonic() - start < timeout:
+                try:
+                    sensor_id, slot, length, stamp = self._result_queue.get(timeout=0.1)
+                except queue.Empty:
+                    continue
+                Xyzi = self._point_buffers[sensor_id].slot(slot, length)
+                self._publish(sensor_id, stamp, Xyzi, False)
+                if any(merged for _, merged in self._subscribers):
+                    self._merge(sensor_id, slot, stamp, Xyzi)
+                else:
+                    self._point_buffers[sensor_id].release(slot)
+        except KeyboardInterrupt as e:
+            print(e)
+
+    # Capture processes are terminated, decode workers finish queued frames
+    def stop(self):
+        for process in self._processes[:len(self.sensors)]:
+            process.terminate()
+        for _ in range(self.workers):
+            self._task_queue.put(None)
+
+        # Worker can't exit until its results are drained from the queue
+        for process in self._processes:
+            while process.is_alive():
+                try:
+                    self._result_queue.get(timeout=0.1)
+                except queue.Empty:
+                    pass
+            process.join()
+        self._latest.clear()
+        for frames in self._frame_buffers + self._point_buffers:
+            frames.close()
 
-    while 1:
-        # Receive XYZ coordinate information using polling to prevent a communication conflict
-        if shared_XYZI[0].poll():
-            Xyzi = shared_XYZI[0].recv()
-        
-        # Update XYZ data in BEV
-        if Xyzi != []:
-            update_point_cloud(Xyzi)
-
-            
 # ============= Multiprocessing Pipeline Main Loop ============= #
 if __name__ == '__main__':
 
-    # Definition Shared Memory using multiprocessing.Pipe()
-    # conn1, conn2: Packet data(1080bytes)
-    # shared_data : 1 frame data(1080 * N bytes)
-    # shared_XYZ  : X, Y, Z coordinate information through unpacking shared data
-    conn1, conn2 = Pipe()
-    shared_data = Pipe()
-    shared_XYZI = Pipe()
+    # Command line option: live sensor(default) or replay of binary log / pcap
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--port', type=int, default=PORT)
+    parser.add_argument('--calibration', default=None, help="angle correction CSV")
+    parser.add_argument('--record', default=None, help="directory of raw packet log")
+    parser.add_argument('--replay', nargs='+', default=None, help="binary log or pcap files (glob allowed)")
+    parser.add_argument('--rate', type=float, default=1.0, help="replay speed (0: as fast as possible)")
+    parser.add_argument('--returns', default="all", choices=["all", "first", "strongest", "last", "dedup"], help="return of dual return mode")
+    parser.add_argument('--velocity', type=float, nargs=3, default=None, help="de-skew by constant linear velocity(m/s) in sensor frame")
+    parser.add_argument('--angular', type=float, nargs=3, default=(0.0, 0.0, 0.0), help="angular velocity(rad/s) for de-skew")
+    parser.add_argument('--poses', default=None, help="de-skew by ego pose file (time x y z qw qx qy qz per line, sensor in world frame)")
+    parser.add_argument('--min-range', type=float, default=0.0, help="range gate(m) before projection")
+    parser.add_argument('--max-range', type=float, default=None)
+    parser.add_argument('--sector', type=float, nargs=2, default=None, help="azimuth sector start end(deg)")
+    parser.add_argument('--channels', type=int, nargs='+', default=None, help="channel 0~31 to keep")
+    parser.add_argument('--min-intensity', type=int, default=0, help="raw reflectivity threshold(0~255)")
+    parser.add_argument('--column-stride', type=int, default=1, help="keep every N-th firing")
+    parser.add_argument('--voxel', type=float, default=None, help="voxel grid size(m) after projection")
+    parser.add_argument('--organized', action='store_true', help="emit 32 x firing range image instead of point list")
+    parser.add_argument('--view-range', type=float, default=VIEW_RANGE, help="half width(m) of BEV viewer")
+    parser.add_argument('--view-mode', default="intensity", choices=["intensity", "occupancy"])
+    parser.add_argument('--sensor', action='append', default=None, help="multi-sensor: PORT[,HOST[,CALIBRATION[,EXTRINSIC]]] (EXTRINSIC: 4x4 text file)")
+    parser.add_argument('--workers', type=int, default=DECODE_WORKER_NUM, help="decode worker number of multi-sensor pipeline")
+    parser.add_argument('--merge', action='store_true', help="view / save time-aligned cloud of every sensor in vehicle frame")
+    parser.add_argument('--save', default=None, help="directory of point cloud files")
+    parser.add_argument('--format', default="kitti", choices=["kitti", "pcd"])
+    parser.add_argument('--pcd-data', default="binary", choices=["ascii", "binary", "binary_compressed"])
+    args = parser.parse_args()
+    if args.velocity is not None and args.poses is not None:
+        parser.error("--velocity and --poses are exclusive")
+    point_filter = PolarFilter(args.min_range, args.max_range, args.sector, args.channels, args.min_intensity, args.column_stride)
+
+    # Multi-sensor pipeline: capture / assembly per sensor, shared decode worker pool, viewer and writer as subscribers
+    if args.sensor is not None:
+        sensors = []
+        for spec in args.sensor:
+            fields = spec.split(',') + [None] * 3
+            extrinsic = np.loadtxt(fields[3]) if fields[3] else None
+            sensors.append(SensorConfig(int(fields[0]), fields[1] or None, fields[2] or None, extrinsic, returns=args.returns,
+                                        point_filter=point_filter, voxel_size=args.voxel))
+        pipeline = XT32Pipeline(sensors, args.workers)
+        points = pipeline.subscribe(SharedFrameBuffer((XT_MAX_FRAME_POINT * len(sensors), 4), np.float32), merged=args.merge)
+        processes = [Process(target = visualization, args=(points, False, args.view_range, args.view_mode))]
+        writer_queue = None
+        if args.save is not None:
+            writer_queue = pipeline.subscribe(SharedFrameBuffer((XT_MAX_FRAME_POINT * len(sensors), 4), np.float32, slot_num=WRITER_QUEUE_SIZE), merged=args.merge)
+            processes.append(Process(target = writer, args=(writer_queue, args.save, args.format, args.pcd_data)))
+        for process in processes:
+            process.start()
+        pipeline.start()
+        try:
+            pipeline.run()
+        finally:
+            pipeline.stop()
+            for process in processes:
+                process.terminate()
+            points.close()
+            if writer_queue is not None:
+                writer_queue.close()
+        raise SystemExit
+
+    # Definition Shared Memory using multiprocessing.shared_memory
+    # ring  : Packet data(1080bytes) in lock-free ring slots
+    # frames: 1 frame data(1080 * N bytes), double-buffered
+    # points: X, Y, Z, I coordinate information through unpacking frame (or range image), double-buffered
+    ring = PacketRing()
+    frames = SharedFrameBuffer(XT_MAX_FRAME_SIZE, np.uint8)
+    if args.organized:
+        points = SharedFrameBuffer(XT_MAX_IMAGE_SIZE, np.float32)
+    else:
+        points = SharedFrameBuffer((XT_MAX_FRAME_POINT, 4), np.float32)
     
-    # Multiprocessing capture, save data, unpacking, visualization
-    processA = Process(target = capture, args = (PORT, conn1))
+    # Multiprocessing capture(or replay), save data, unpacking, visualization
+    if args.replay is None:
+        processA = Process(target = capture, args = (args.port, ring), kwargs = {'record_dir': args.record})
+    else:
+        paths = sorted(sum((glob.glob(path) for path in args.replay), []))
+        processA = Process(target = replay, args = (paths, ring, args.rate, args.port))
     processA.start()
-    processB = Process(target = save_data, args = (shared_data, conn2))
+    processB = Process(target = save_data, args = (ring, frames), kwargs = {'lossless': args.replay is not None and args.rate == 0})
     processB.start()
-    processC = Process(target = unpack, args=(shared_data, shared_XYZI))
+    writer_queue = DropOldestQueue() if args.save is not None else None
+    motion = ConstantVelocity(args.velocity, args.angular) if args.velocity is not None else None
+    if args.poses is not None:
+        motion = PoseTrajectory.load(args.poses)
+    processC = Process(target = unpack, args=(frames, points, args.calibration, writer_queue, args.returns, motion),
+                       kwargs = {'point_filter': point_filter, 'voxel_size': args.voxel, 'organized': args.organized})
     processC.start()
-    processD = Process(target = visualization, args=(shared_XYZI,))
+    processD = Process(target = visualization, args=(points, args.organized, args.view_range, args.view_mode))
     processD.start()
+    processes = [processA, processB, processC, processD]
+
+    # Optional writer process with its own bounded queue
+    if writer_queue is not None:
+        processE = Process(target = writer, args=(writer_queue, args.save, args.format, args.pcd_data))
+        processE.start()
+        processes.append(processE)
+
+    # Release shared memory after pipeline is finished
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt as e:
+        print(e)
+    finally:
+        ring.close()
+        frames.close()
+        points.close()
@@ -0,0 +1,249 @@
+'''
+* ***********************************************************************************************
+* @brief	  Tests of HESAI Pandar XT32 Interface (run: python -m pytest -q)
+* @Version	  Python 3.8
+* ***********************************************************************************************
+'''
+import time
+import struct
+import numpy as np
+import pytest
+
+import HESAI_Pandar_XT32_Interface
+
+from HESAI_Pandar_XT32_Interface import (
+    XT_DATA_SIZE, XT_HEAD_SIZE, XT_BODY_SIZE, XT_BLOCK_SIZE, XT_BLOCK_NUMBER, XT_UNIT_NUM, XT_UNIT_SIZE,
+    XT_MAX_POINT_SIZE, XT_RETURN_LAST_STRONGEST, decodeFrame, decodeTimes, SequenceCounter, PolarFilter, packetView, firingBlocks, PacketGenerator, PacketReplay,
+    XT_MAX_IMAGE_WIDTH, XT_MAX_IMAGE_SIZE, imageWidth, rangeImage, XT_MOTOR_SPEED_OFFSET, FrameAssembler,
+    writePCDFile, XT_BLOCK_TIME_BASE, XT_CHANNEL_TIME_OFFSET, packetTime, ConstantVelocity, PoseTrajectory, deskew, unpack,
+    SharedFrameBuffer,
+)
+
+# Reference: per-packet byte slicing of the previous unpack() loop
+def decodeFrameReference(raw_data):
+    N = len(raw_data) // XT_DATA_SIZE
+    int_azim_0 = np.empty(XT_MAX_POINT_SIZE * N, dtype=np.uint8)
+    int_azim_1 = np.empty(XT_MAX_POINT_SIZE * N, dtype=np.uint8)
+    int_dist_0 = np.empty(XT_MAX_POINT_SIZE * N, dtype=np.uint8)
+    int_dist_1 = np.empty(XT_MAX_POINT_SIZE * N, dtype=np.uint8)
+    int_refl   = np.empty(XT_MAX_POINT_SIZE * N, dtype=np.uint8)
+    for i in range(N):
+        i_pck = XT_DATA_SIZE * i
+        body = raw_data[i_pck + XT_HEAD_SIZE : i_pck + XT_HEAD_SIZE + XT_BODY_SIZE]
+        i_bin = XT_MAX_POINT_SIZE * i
+        for block in range(XT_BLOCK_NUMBER):
+            b = XT_BLOCK_SIZE * block
+            i_blk = i_bin + XT_UNIT_NUM * block
+            int_azim_0[i_blk : i_blk + XT_UNIT_NUM] = [body[b]] * XT_UNIT_NUM
+            int_azim_1[i_blk : i_blk + XT_UNIT_NUM] = [body[b + 1]] * XT_UNIT_NUM
+            int_dist_0[i_blk : i_blk + XT_UNIT_NUM] = [body[b + 2 + XT_UNIT_SIZE * u] for u in range(XT_UNIT_NUM)]
+            int_dist_1[i_blk : i_blk + XT_UNIT_NUM] = [body[b + 3 + XT_UNIT_SIZE * u] for u in range(XT_UNIT_NUM)]
+            int_refl[i_blk : i_blk + XT_UNIT_NUM] = [body[b + 4 + XT_UNIT_SIZE * u] for u in range(XT_UNIT_NUM)]
+    azim = (np.uint16(int_azim_1) << 8) | int_azim_0
+    range_ = (np.uint16(int_dist_1) << 8) | int_dist_0
+    return azim, range_, int_refl
+
+@pytest.mark.parametrize("seed, packets", [(0, 1), (1, 7), (2, 180)])
+def test_decode_frame_matches_reference(seed, packets):
+    raw_data = np.random.default_rng(seed).integers(0, 256, XT_DATA_SIZE * packets, dtype=np.uint8).tobytes()
+    for actual, expected in zip(decodeFrame(raw_data), decodeFrameReference(raw_data)):
+        assert actual.dtype == expected.dtype
+        np.testing.assert_array_equal(actual, expected)
+
+def test_sequence_counter_duplicate_is_not_reordered():
+    counter = SequenceCounter()
+    for sequence in [1, 2, 6, 6, 3, 3, 5, 4, 7]:
+        counter.update(sequence)
+    assert (counter.received, counter.dropped, counter.reordered, counter.duplicated) == (9, 0, 3, 2)
+
+def test_sequence_counter_duplicate_keeps_loss():
+    counter = SequenceCounter()
+    for sequence in [0xFFFFFFFE, 2, 2, 2, 0xFFFFFFFF]:
+        counter.update(sequence)
+    assert (counter.dropped, counter.reordered, counter.duplicated) == (2, 1, 2)
+
+def test_sequence_counter_resyncs_after_restart():
+    counter = SequenceCounter()
+    for sequence in list(range(1000, 1010)) + list(range(0, 20)) + [5, 22]:
+        counter.update(sequence)
+    assert (counter.received, counter.dropped, counter.reordered, counter.duplicated, counter.restarted) == (32, 2, 0, 1, 1)
+
+# Ethernet + IPv4 + UDP record of libpcap file
+def pcapRecord(payload, port, t):
+    ip = bytes([0x45, 0, 0, 0, 0, 0, 0, 0, 64, 17, 0, 0]) + bytes(8)
+    frame = bytes(14) + ip + struct.pack('>HHHH', 5000, port, 8 + len(payload), 0) + payload
+    return struct.pack('<IIII', int(t), int(t % 1 * 1e6), len(frame), len(frame)) + frame
+
+def test_pcap_replay_skips_packets_of_other_size(tmp_path):
+    packets = PacketGenerator().generate(100).tobytes()
+    fname = tmp_path / "xt32.pcap"
+    with open(fname, 'wb') as fp:
+        fp.write(struct.pack('<IHHiIII', 0xa1b2c3d4, 2, 4, 0, 0, 65535, 1))
+        for i in range(100):
+            if i % 30 == 0:
+                fp.write(pcapRecord(bytes(512), 10110, i))
+            fp.write(pcapRecord(packets[i * XT_DATA_SIZE : (i + 1) * XT_DATA_SIZE], 2368, i + 0.5))
+    replay = PacketReplay(str(fname))
+    assert len(replay) == 100
+    np.testing.assert_allclose(replay.times, np.arange(100) + 0.5)
+    assert all(bytes(replay[i]) == packets[i * XT_DATA_SIZE : (i + 1) * XT_DATA_SIZE] for i in range(100))
+    replay.close()
+
+def test_missing_return_falls_back_to_all():
+    raw_data = PacketGenerator(return_mode=XT_RETURN_LAST_STRONGEST).generate(4).tobytes()
+    with pytest.warns(UserWarning):
+        azim, dist, refl = decodeFrame(raw_data, "first")
+        times = decodeTimes(raw_data, "first")
+    np.testing.assert_array_equal(dist, decodeFrame(raw_data, "all")[1])
+    assert len(times) == len(dist)
+
+def test_column_stride_keeps_both_returns_of_firing():
+    raw_data = PacketGenerator(return_mode=XT_RETURN_LAST_STRONGEST).generate(50).tobytes()
+    azim, dist, refl = decodeFrame(raw_data, "all")
+    dist[:] = 1
+    i_valid = PolarFilter(column_stride=2).apply(azim, dist, refl, firingBlocks(packetView(raw_data), "all"))
+    assert len(np.unique(azim[i_valid])) == len(np.unique(azim)) // 2
+    assert set(i_valid // XT_UNIT_NUM % 2) == {0, 1}
+
+@pytest.mark.parametrize("motor_speed", [0, 599, 600, 1200, 1])
+def test_range_image_fits_slot(motor_speed):
+    width = imageWidth(motor_speed)
+    assert 1 <= width <= XT_MAX_IMAGE_WIDTH
+    azim = np.array([0, 17999, 35999], dtype=np.uint16)
+    channel = np.array([0, 15, 31])
+    Xyzi = np.ones((3, 4), dtype=np.float32)
+    image = rangeImage(azim, channel, np.array([250, 500, 750]), Xyzi, width, out=np.empty(XT_MAX_IMAGE_SIZE, dtype=np.float32))
+    assert image.shape == (XT_UNIT_NUM, width, 5)
+    np.testing.assert_allclose(image[channel, azim.astype(np.int64) * width // 36000, 0], [1.0, 2.0, 3.0])
+
+# Packet number of frames cut by frame assembler (motor_speeds: RPM written to every packet tail)
+def assembleFrames(raw_data, motor_speeds=None):
+    assembler = FrameAssembler()
+    packets = bytearray(raw_data)
+    sizes = []
+    for i in range(len(packets) // XT_DATA_SIZE):
+        packet = packets[i * XT_DATA_SIZE : (i + 1) * XT_DATA_SIZE]
+        if motor_speeds is not None:
+            packet[XT_MOTOR_SPEED_OFFSET : XT_MOTOR_SPEED_OFFSET + 2] = int(motor_speeds[i]).to_bytes(2, 'little')
+        frame = assembler.push(memoryview(packet))
+        if frame is not None:
+            sizes.append(len(frame) // XT_DATA_SIZE)
+    return sizes
+
+def test_frame_assembler_keeps_frame_with_jittering_motor_speed():
+    generator = PacketGenerator()
+    raw_data = b"".join(generator.revolution().tobytes() for _ in range(6))
+    motor_speeds = np.random.default_rng(0).choice([599, 600, 601], len(raw_data) // XT_DATA_SIZE)
+    assert assembleFrames(raw_data) == [250] * 4
+    assert assembleFrames(raw_data, motor_speeds) == [250] * 4
+
+@pytest.mark.parametrize("swap, expected", [(499, [249, 251, 250, 250]), (610, [250] * 4)])
+def test_frame_assembler_reordered_pair_does_not_wrap_twice(swap, expected):
+    generator = PacketGenerator()
+    packets = bytearray(b"".join(generator.revolution().tobytes() for _ in range(6)))
+    first = bytes(packets[swap * XT_DATA_SIZE : (swap + 1) * XT_DATA_SIZE])
+    packets[swap * XT_DATA_SIZE : (swap + 1) * XT_DATA_SIZE] = packets[(swap + 1) * XT_DATA_SIZE : (swap + 2) * XT_DATA_SIZE]
+    packets[(swap + 1) * XT_DATA_SIZE : (swap + 2) * XT_DATA_SIZE] = first
+    assert assembleFrames(packets) == expected
+
+# LZF decompression (literal run and back reference)
+def lzfDecompress(data, size):
+    out = bytearray()
+    i = 0
+    while i < len(data):
+        ctrl = data[i]
+        i += 1
+        if ctrl < 32:
+            out += data[i : i + ctrl + 1]
+            i += ctrl + 1
+        else:
+            length = ctrl >> 5
+            if length == 7:
+                length += data[i]
+                i += 1
+            ref = len(out) - ((ctrl & 0x1F) << 8) - data[i] - 1
+            i += 1
+            for k in range(length + 2):
+                out.append(out[ref + k])
+    assert len(out) == size
+    return bytes(out)
+
+# X, Y, Z, I (N x 4) of PCD file written by writePCDFile
+def readPCDFile(fname):
+    with open(fname, 'rb') as fp:
+        header = {}
+        while 'DATA' not in header:
+            key, value = fp.readline().decode().split(' ', 1)
+            header[key] = value.strip()
+        body = fp.read()
+    points = int(header['POINTS'])
+    if header['DATA'] == 'binary':
+        return np.frombuffer(body, dtype=np.float32).reshape(points, 4)
+    compressed, size = struct.unpack_from('<II', body)
+    raw = lzfDecompress(body[8 : 8 + compressed], size)
+    return np.frombuffer(raw, dtype=np.float32).reshape(4, points).T
+
+@pytest.mark.parametrize("points", [0, 1, 8, 1000])
+@pytest.mark.parametrize("data", ["binary", "binary_compressed"])
+def test_pcd_round_trip(tmp_path, monkeypatch, points, data):
+    # LZF literal fallback of writePCDFile when lzf module is not installed
+    monkeypatch.setattr(HESAI_Pandar_XT32_Interface, "lzf", None)
+    Xyzi = np.random.default_rng(points).normal(size=(points, 4)).astype(np.float32)
+    fname = str(tmp_path / "cloud.pcd")
+    writePCDFile(fname, Xyzi[:, 0], Xyzi[:, 1], Xyzi[:, 2], Xyzi[:, 3], data)
+    np.testing.assert_array_equal(readPCDFile(fname), Xyzi)
+
+def test_decode_times_of_revolution():
+    raw_data = PacketGenerator().revolution().tobytes()
+    times = decodeTimes(raw_data)
+    last = packetTime(packetView(raw_data)[-1:])[0]
+    assert times.max() == pytest.approx(last + XT_BLOCK_TIME_BASE + XT_CHANNEL_TIME_OFFSET[-1], abs=1e-6)
+    assert times.max() - times.min() == pytest.approx(0.1, abs=1e-3)
+
+# Static world points seen in sensor frame at every point time while sensor translates at velocity(m/s)
+def movingScan(velocity):
+    raw_data = PacketGenerator().revolution().tobytes()
+    times = decodeTimes(raw_data)[::16]
+    world = np.random.default_rng(0).uniform(-20, 20, (len(times), 3))
+    Xyzi = np.zeros((len(times), 4), dtype=np.float32)
+    Xyzi[:, 0:3] = world - np.outer(times - times[0], velocity)
+    return world, times, Xyzi
+
+def test_constant_velocity_deskew_recovers_static_scene():
+    velocity = np.array([10.0, -2.0, 0.5])
+    world, times, Xyzi = movingScan(velocity)
+    deskew(Xyzi, times, ConstantVelocity(velocity))
+    np.testing.assert_allclose(Xyzi[:, 0:3], world - velocity * (times.max() - times[0]), atol=1e-4)
+
+def test_pose_trajectory_deskew_recovers_static_scene():
+    velocity = np.array([10.0, -2.0, 0.5])
+    world, times, Xyzi = movingScan(velocity)
+    trajectory = PoseTrajectory()
+    for t in np.linspace(times[0], times.max(), 5):
+        trajectory.append(t, velocity * (t - times[0]), [1.0, 0.0, 0.0, 0.0])
+    deskew(Xyzi, times, trajectory)
+    np.testing.assert_allclose(Xyzi[:, 0:3], world - velocity * (times.max() - times[0]), atol=1e-4)
+
+def test_pose_queue_requires_pose_trajectory():
+    with pytest.raises(ValueError):
+        unpack(None, None, motion=ConstantVelocity((1.0, 0.0, 0.0)), pose_queue=object())
+
+def test_shared_frame_buffer_drop_oldest():
+    frames = SharedFrameBuffer((4, 4), np.float32, slot_num=3)
+    time.sleep(0.1)
+    try:
+        for k in range(10):
+            index, buffer = frames.acquire(drop_oldest=True)
+            buffer[:] = k
+            frames.publish(index, len(buffer))
+        received = []
+        while 1:
+            index, frame = frames.receive(timeout=0.2)
+            if frame is None:
+                break
+            received.append(int(frame[0, 0]))
+            frames.release(index)
+        assert received == [7, 8, 9]
+        assert frames.dropped == 7
+    finally:
+        frames.close()